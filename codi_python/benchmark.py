@@ -0,0 +1,127 @@
+# python benchmark.py results.json [baseline.json] measures building,
+# copying and simulating adders of 1 to 64 bits, writes the results to
+# results.json and exits with status 1 if any is more than 20% worse than
+# those of baseline.json
+from copy import deepcopy
+import json
+import logging
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from circuits import (Component, build_n_bits_adder, build_native_one_bit_adder,
+                      build_one_bit_adder, build_xor)
+
+logger = logging.getLogger('benchmark')
+
+
+def best_seconds(function, repeat=5, min_seconds=0.02):
+    # Seconds per call of function, the least of repeat rounds, the one
+    # least disturbed by the rest of the system. Each round makes as many
+    # calls as last at least min_seconds, so that fast functions are not
+    # timed by the resolution of the clock.
+    number = 1
+    while True:
+        seconds = timed_calls(function, number)
+        if seconds >= min_seconds:
+            break
+        number *= 2
+    times = [seconds] + [timed_calls(function, number) for _ in range(repeat - 1)]
+    return min(times) / number
+
+
+def timed_calls(function, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        function()
+    return time.perf_counter() - start
+
+
+def count_gates(circuit):
+    if isinstance(circuit, Component):
+        return sum(count_gates(subcircuit) for subcircuit in circuit.circuits)
+    return 1
+
+
+def benchmark_design(build, num_vectors=100, seed=0):
+    # The cost of a design made by build(): seconds to build and to deepcopy
+    # it, process() throughput with random input vectors and bytes per gate
+    tracemalloc.start()
+    component = build()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    num_gates = count_gates(component)
+    rng = random.Random(seed)
+    vectors = [[rng.random() < 0.5 for _ in component.inputs] for _ in range(num_vectors)]
+
+    def simulate():
+        for vector in vectors:
+            for pin, state in zip(component.inputs, vector):
+                pin.set_state(state)
+            component.process()
+    return {
+        'gates': num_gates,
+        'build_seconds': best_seconds(build),
+        'deepcopy_seconds': best_seconds(lambda: deepcopy(component)),
+        'vectors_per_second': num_vectors / best_seconds(simulate, repeat=3),
+        'bytes_per_gate': memory / num_gates,
+    }
+
+
+# whether more (+1) or less (-1) is better
+benchmark_metrics = {'build_seconds': -1, 'deepcopy_seconds': -1,
+                     'vectors_per_second': +1, 'bytes_per_gate': -1}
+
+
+def run_benchmarks(designs, file_name=None, baseline_file_name=None, tolerance=0.2):
+    # Benchmarks designs, pairs (name, build), saving the results as JSON to
+    # file_name and comparing them with those of baseline_file_name. Returns
+    # the results and the regressions, metrics worse than the baseline by
+    # more than tolerance (0.2 = 20%).
+    results = {'python': platform.python_version(), 'designs': {}}
+    for name, build in designs:
+        results['designs'][name] = benchmark_design(build)
+        logger.info('benchmark %s: %s', name, results['designs'][name])
+    if file_name is not None:
+        with open(file_name, 'w') as file:
+            json.dump(results, file, indent=1)
+    regressions = []
+    if baseline_file_name is not None:
+        with open(baseline_file_name) as file:
+            baseline = json.load(file)
+        regressions = compare_benchmarks(results, baseline, tolerance)
+    return results, regressions
+
+
+def compare_benchmarks(results, baseline, tolerance=0.2):
+    regressions = []
+    for name, metrics in results['designs'].items():
+        for metric, sign in benchmark_metrics.items():
+            if name not in baseline['designs'] or metric not in baseline['designs'][name]:
+                continue
+            old = baseline['designs'][name][metric]
+            new = metrics[metric]
+            if sign * (new - old) < -tolerance * old:
+                regressions.append('{} {}: {:.4g} -> {:.4g} ({:+.0%})'.format(
+                    name, metric, old, new, new / old - 1))
+    return regressions
+
+
+designs = [('xor', build_xor), ('OneBitAdder', build_one_bit_adder)]
+designs += [('{}BitsAdder'.format(k), lambda k=k: build_n_bits_adder(k))
+            for k in [1, 2, 4, 8, 16, 32, 64]]
+designs += [('Native{}BitsAdder'.format(k),
+             lambda k=k: build_n_bits_adder(k, build_native_one_bit_adder))
+            for k in [1, 2, 4, 8, 16, 32, 64]]
+
+if __name__ == '__main__':
+    if not 2 <= len(sys.argv) <= 3:
+        sys.exit('usage: python benchmark.py results.json [baseline.json]')
+    results, regressions = run_benchmarks(designs, *sys.argv[1:])
+    for name, metrics in results['designs'].items():
+        print(name, metrics)
+    for regression in regressions:
+        print('regression:', regression)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,2424 @@
+from abc import ABC
+from array import array
+import bisect
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from fnmatch import fnmatchcase
+from functools import reduce
+import heapq
+import itertools
+import json
+import logging
+import logging.handlers
+import mmap
+import multiprocessing
+import operator
+import os
+import random
+import re
+import struct
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# connections and disconnections are logged at DEBUG level, which is off
+# unless configured, see log_connections()
+logger = logging.getLogger('circuits')
+
+
+# class Id():
+#     id = 0
+#     @staticmethod
+#     def get():
+#         Id.id += 1
+#         return str(Id.id)
+
+class Circuit(ABC):
+    __slots__ = ('name', 'inputs', 'outputs', 'connections', 'parent', 'buses')
+    sequential = False # True for circuits with memory, like flip-flops
+    caches = () # attributes not copied by deepcopy, made again on request
+    shared = () # attributes that deepcopy does not copy but shares
+
+    def __init__(self, name, num_inputs, num_outputs):
+        self.name = name
+        self.inputs = [Pin(None, self, 'input', i) for i in range(num_inputs)]
+        self.outputs = [Pin(None, self, 'output', i) for i in range(num_outputs)]
+        self.connections = []
+        self.parent = None # the component it has been added to
+        self.buses = None # name -> Bus, made by the first add_bus()
+
+    def rename(self, new_name):
+        # O(1): the names and paths of the pins and of the circuits inside
+        # are made on request, see Pin.name and path()
+        self.changed()
+        if self.parent is not None:
+            children = self.parent.children
+            if children.get(self.name) is self:
+                del children[self.name]
+            children.setdefault(new_name, self)
+        self.name = new_name
+
+    def changed(self):
+        # the structure of the circuit changed: the caches of the components
+        # that contain it, made from their structure, are out of date
+        circuit = self
+        while circuit is not None:
+            for attribute in circuit.caches:
+                setattr(circuit, attribute, None)
+            circuit = circuit.parent
+
+    def path(self):
+        names = []
+        circuit = self
+        while circuit is not None:
+            names.append(circuit.name)
+            circuit = circuit.parent
+        return '/'.join(reversed(names))
+
+    def __deepcopy__(self, memo):
+        # the parent of the copy is set by the component that is copied
+        # with it, if any
+        copy = object.__new__(type(self))
+        memo[id(self)] = copy
+        for cls in type(self).__mro__:
+            for attribute in cls.__dict__.get('__slots__', ()):
+                if attribute in self.shared:
+                    setattr(copy, attribute, getattr(self, attribute))
+                elif attribute == 'parent' or attribute in self.caches:
+                    setattr(copy, attribute, None)
+                else:
+                    setattr(copy, attribute, deepcopy(getattr(self, attribute), memo))
+        if hasattr(self, '__dict__'): # subclasses without __slots__
+            copy.__dict__.update(deepcopy(self.__dict__, memo))
+        return copy
+
+    def process(self):
+        raise NotImplementedError
+        # can not call process(), it's an abstract method
+
+    def pins(self):
+        return self.inputs + self.outputs
+
+    def set_input(self, num_input, state):
+        self.inputs[num_input].set_state(state)
+
+    def add_bus(self, name, pins):
+        # pins, like some inputs, as the bits of an int, pins[0] the least
+        # significant
+        self.changed()
+        if self.buses is None:
+            self.buses = {}
+        self.buses[name] = Bus(name, pins)
+        return self.buses[name]
+
+    def bus(self, name):
+        return self.buses[name]
+
+    def find_pin(self, path):
+        # path like 'input 1', see Pin.path()
+        kind, _, index = path.partition(' ')
+        pins = {'input': self.inputs, 'output': self.outputs}.get(kind)
+        if pins is None or not index.isdigit() or int(index) >= len(pins):
+            return None
+        return pins[int(index)]
+
+    def matching_children(self, pattern):
+        # the circuits inside whose name matches pattern, none but in a Component
+        return []
+
+
+
+class Gate(Circuit):
+    # A circuit of one output, function() of the states of the inputs.
+    # function() gets the states as an iterable, read only until the output
+    # is known. bit_function() is the same for states 0 or 1, like the nets
+    # of a compiled circuit, and packed_function() for words of many input
+    # vectors, one per bit, see CompiledCircuit.evaluate_packed()
+    __slots__ = ()
+
+    def __init__(self, name, num_inputs=2):
+        super().__init__(name, num_inputs, 1)
+
+    def process(self):
+        # a generator for wide gates, so that function() stops reading the
+        # states once the output is known
+        inputs = self.inputs
+        if len(inputs) > 4:
+            self.outputs[0].set_state(self.function(pin.state for pin in inputs))
+        else:
+            self.outputs[0].set_state(self.function([pin.state for pin in inputs]))
+
+
+class And(Gate):
+    __slots__ = ()
+
+    @staticmethod
+    def function(states):
+        # like result = result and state for every state: the first state
+        # that is False (or None), else the last one
+        result = True
+        for state in states:
+            if not state:
+                return state
+            result = state
+        return result
+
+    bit_function = all
+
+    @staticmethod
+    def packed_function(words, mask):
+        return reduce(operator.and_, words, mask)
+
+
+class Or(Gate):
+    __slots__ = ()
+
+    @staticmethod
+    def function(states):
+        # the first state that is True, else the last one
+        result = False
+        for state in states:
+            if state:
+                return state
+            result = state
+        return result
+
+    bit_function = any
+
+    @staticmethod
+    def packed_function(words, mask):
+        # seeded with a zero of the type of mask, so that columns of NumPy
+        # bools stay bools
+        return reduce(operator.or_, words, mask ^ mask)
+
+
+class Not(Gate):
+    __slots__ = ()
+
+    def __init__(self, name, num_inputs=1):
+        # num_inputs, always 1, like the other gates
+        assert num_inputs == 1
+        super().__init__(name, 1)
+
+    @staticmethod
+    def function(states):
+        state, = states
+        return not state
+
+    bit_function = function
+
+    @staticmethod
+    def packed_function(words, mask):
+        return words[0] ^ mask
+
+    def process(self):
+        self.outputs[0].set_state(not self.inputs[0].state)
+
+
+class Nand(Gate):
+    __slots__ = ()
+
+    @staticmethod
+    def function(states):
+        return not And.function(states)
+
+    @staticmethod
+    def bit_function(states):
+        return not all(states)
+
+    @staticmethod
+    def packed_function(words, mask):
+        return reduce(operator.and_, words, mask) ^ mask
+
+
+class Nor(Gate):
+    __slots__ = ()
+
+    @staticmethod
+    def function(states):
+        return not Or.function(states)
+
+    @staticmethod
+    def bit_function(states):
+        return not any(states)
+
+    @staticmethod
+    def packed_function(words, mask):
+        return reduce(operator.or_, words, mask ^ mask) ^ mask
+
+
+class Xor(Gate):
+    # True if an odd number of inputs are True
+    __slots__ = ()
+
+    @staticmethod
+    def function(states):
+        result = False
+        for state in states:
+            if state:
+                result = not result
+        return result
+
+    @staticmethod
+    def bit_function(states):
+        return sum(states) & 1
+
+    @staticmethod
+    def packed_function(words, mask):
+        return reduce(operator.xor, words, mask ^ mask)
+
+
+class Xnor(Gate):
+    __slots__ = ()
+
+    @staticmethod
+    def function(states):
+        return not Xor.function(states)
+
+    @staticmethod
+    def bit_function(states):
+        return not sum(states) & 1
+
+    @staticmethod
+    def packed_function(words, mask):
+        return reduce(operator.xor, words, mask ^ mask) ^ mask
+
+
+class Mux(Gate):
+    # A multiplexer of 2**k data inputs and then k select inputs, select
+    # input j the bit j of the number of the data input that is the output:
+    # Mux(name) is a 2:1 mux (d0, d1, s), Mux(name, 6) a 4:1 mux
+    # (d0, d1, d2, d3, s0, s1)
+    __slots__ = ()
+
+    def __init__(self, name, num_inputs=3):
+        num_select = num_inputs.bit_length() - 1
+        assert num_inputs == 2**num_select + num_select
+        super().__init__(name, num_inputs)
+
+    @staticmethod
+    def function(states):
+        states = list(states)
+        num_data = 2 ** (len(states).bit_length() - 1)
+        return states[sum(1 << j for j, state in enumerate(states[num_data:]) if state)]
+
+    bit_function = function
+
+    @staticmethod
+    def packed_function(words, mask):
+        num_data = 2 ** (len(words).bit_length() - 1)
+        result = mask ^ mask
+        for i in range(num_data):
+            term = words[i]
+            for j, select in enumerate(words[num_data:]):
+                # not &=, that would change words[i] if it is a NumPy array
+                term = term & (select if i >> j & 1 else select ^ mask)
+            result |= term
+        return result
+
+
+class Clock(Circuit):
+    __slots__ = ('state',)
+    sequential = True
+
+    def __init__(self, name):
+        super().__init__(name, 0, 1)
+        self.state = False
+
+    def tick(self):
+        self.state = not self.state
+
+    def process(self):
+        self.outputs[0].set_state(self.state)
+
+
+class DFlipFlop(Circuit):
+    # input 0 is data, input 1 the clock. The output takes the data at each
+    # rising edge of the clock.
+    __slots__ = ('state', 'last_clock')
+    sequential = True
+
+    def __init__(self, name, state=False):
+        super().__init__(name, 2, 1)
+        self.state = state
+        self.last_clock = False
+
+    def process(self):
+        clock = self.inputs[1].is_state()
+        if clock and not self.last_clock:
+            self.state = self.inputs[0].is_state()
+        self.last_clock = clock
+        self.outputs[0].set_state(self.state)
+
+
+class Instance(Circuit):
+    # A use of a component, the definition, that is shared by all its
+    # instances instead of being copied: an instance has only its own pins
+    # and the states of the nets of the compiled definition.
+    __slots__ = ('definition', 'nets')
+    shared = ('definition',)
+
+    def __init__(self, name, definition):
+        super().__init__(name, len(definition.inputs), len(definition.outputs))
+        self.definition = definition
+        self.nets = None
+
+    def process(self):
+        # The flip-flops of the definition take their data at a rising edge
+        # of its clock, that must be an input: nothing ticks a Clock inside
+        compiled = self.definition.compile()
+        if compiled.registers and compiled.clock_net not in compiled.input_nets:
+            raise ValueError('the flip-flops of instance {} are not clocked by an input'.format(
+                self.name))
+        if self.nets is None or len(self.nets) != compiled.num_nets:
+            self.nets = bytearray(compiled.nets)
+        nets = self.nets
+        last_clock = nets[compiled.clock_net] if compiled.registers else 0
+        for net, pin in zip(compiled.input_nets, self.inputs):
+            nets[net] = bool(pin.is_state())
+        compiled.process(nets)
+        if compiled.registers and nets[compiled.clock_net] and not last_clock:
+            states = [nets[d] for d, q in compiled.registers]
+            for (d, q), state in zip(compiled.registers, states):
+                nets[q] = state
+            compiled.process(nets)
+        for net, pin in zip(compiled.output_nets, self.outputs):
+            pin.set_state(bool(nets[net]))
+
+
+class Component(Circuit):
+    __slots__ = ('circuits', 'children', 'compiled', 'order')
+    caches = ('compiled', 'order')
+    max_iterations = 100 # of process() of a feedback loop before giving up
+
+    def __init__(self, name, num_inputs, num_outputs):
+        super().__init__(name, num_inputs, num_outputs)
+        self.circuits = []
+        self.children = {} # name -> circuit
+        self.compiled = None
+        self.order = None
+
+    def add_circuit(self, circuit):
+        self.changed()
+        self.circuits.append(circuit)
+        self.children.setdefault(circuit.name, circuit)
+        circuit.parent = self
+
+    def remove_circuit(self, circuit):
+        self.changed()
+        self.circuits.remove(circuit)
+        if self.children.get(circuit.name) is circuit:
+            del self.children[circuit.name]
+        circuit.parent = None
+
+    # override
+    def pins(self):
+        pins = super().pins()
+        for circuit in self.circuits:
+            pins += circuit.pins()
+        return pins
+
+    def evaluation_order(self):
+        if self.order is None:
+            self.order = self.sort_circuits()
+        return self.order
+
+    def sort_circuits(self):
+        # A circuit is processed after the circuits that drive its inputs,
+        # following the connections also through the pins of this component.
+        # Circuits in a feedback loop (a strongly connected component of the
+        # graph) are grouped, to be processed until they settle. Returns a
+        # list of (circuits, is_loop) in evaluation order.
+        owner = {}
+        for circuit in self.circuits:
+            for pin in circuit.pins():
+                owner[pin] = circuit
+        successors = {circuit: [] for circuit in self.circuits}
+        for circuit in self.circuits:
+            stack = circuit.pins()
+            # an input of its own reached from its pins is an edge to itself
+            seen = set(stack) - set(circuit.inputs)
+            while stack:
+                for observer in stack.pop().observers:
+                    if observer in seen:
+                        continue
+                    seen.add(observer)
+                    other = owner.get(observer)
+                    if other is None:
+                        stack.append(observer)
+                    elif other not in successors[circuit]:
+                        successors[circuit].append(other)
+        groups = strongly_connected_components(self.circuits, successors)
+        position = {circuit: i for i, circuit in enumerate(self.circuits)}
+        group_of = {}
+        for g, group in enumerate(groups):
+            group.sort(key=position.get)
+            for circuit in group:
+                group_of[circuit] = g
+        group_successors = [set() for _ in groups]
+        num_predecessors = [0] * len(groups)
+        for circuit in self.circuits:
+            for other in successors[circuit]:
+                g, h = group_of[circuit], group_of[other]
+                if g != h and h not in group_successors[g]:
+                    group_successors[g].add(h)
+                    num_predecessors[h] += 1
+        # among the groups ready to be processed, first the one added first
+        ready = [(position[group[0]], g) for g, group in enumerate(groups)
+                 if num_predecessors[g] == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            g = heapq.heappop(ready)[1]
+            group = groups[g]
+            order.append((group, len(group) > 1 or group[0] in successors[group[0]]))
+            for h in group_successors[g]:
+                num_predecessors[h] -= 1
+                if num_predecessors[h] == 0:
+                    heapq.heappush(ready, (position[groups[h][0]], h))
+        return order
+
+    def process(self):
+        for circuits, is_loop in self.evaluation_order():
+            if is_loop:
+                self.settle(circuits)
+            else:
+                circuits[0].process()
+
+    def settle(self, circuits):
+        # fixed-point iteration of a feedback loop
+        pins = [pin for circuit in circuits for pin in circuit.pins()]
+        states = [pin.is_state() for pin in pins]
+        for _ in range(self.max_iterations):
+            for circuit in circuits:
+                circuit.process()
+            new_states = [pin.is_state() for pin in pins]
+            if new_states == states:
+                return
+            states = new_states
+        raise OscillationError('{} do not settle after {} iterations'.format(
+            ', '.join(circuit.name for circuit in circuits), self.max_iterations))
+
+    def compile(self):
+        # also compiled again if the definition of an instance inside changed
+        if self.compiled is None or any(definition.compile() is not compiled for
+                                        definition, compiled in self.compiled.definitions.items()):
+            self.compiled = CompiledCircuit.from_component(self)
+        return self.compiled
+
+    def evaluate_batch(self, inputs):
+        # inputs is a NumPy (N, num_inputs) array of bools, and so is the
+        # (N, num_outputs) result. Without NumPy, a list of rows of bools.
+        compiled = self.compile()
+        if np is not None and isinstance(inputs, np.ndarray):
+            inputs = inputs.astype(bool, copy=False)
+            outputs = compiled.evaluate_packed(
+                [inputs[:, k] for k in range(inputs.shape[1])])
+            return np.column_stack([np.broadcast_to(output, len(inputs))
+                                    for output in outputs])
+        vectors = [sum(bool(state) << k for k, state in enumerate(row))
+                   for row in inputs]
+        words = compiled.evaluate_packed(pack_vectors(vectors, len(self.inputs)),
+                                         len(vectors))
+        return [[bool(vector >> k & 1) for k in range(len(self.outputs))]
+                for vector in unpack_words(words, len(vectors))]
+
+    def truth_table(self):
+        # rows in the order of the tests: input 0 is the most significant
+        num_inputs = len(self.inputs)
+        if np is not None:
+            shifts = np.arange(num_inputs - 1, -1, -1)
+            inputs = (np.arange(2**num_inputs)[:, None] >> shifts & 1).astype(bool)
+        else:
+            inputs = [list(row) for row in
+                      itertools.product([False, True], repeat=num_inputs)]
+        return inputs, self.evaluate_batch(inputs)
+
+    # override
+    def find_pin(self, path):
+        # path relative to this component, like 'xor2/and1/input 1': one
+        # dictionary lookup per level
+        circuit = self
+        *names, pin_path = path.split('/')
+        for name in names:
+            circuit = getattr(circuit, 'children', {}).get(name)
+            if circuit is None:
+                return None
+        return Circuit.find_pin(circuit, pin_path)
+
+    def find_pins(self, pattern):
+        # pins whose relative path matches pattern, with the wildcards of
+        # fnmatch at any level, like 'oneBitAdder*/xor?/and1/input *'. Levels
+        # without wildcards are dictionary lookups.
+        *names, pin_pattern = pattern.split('/')
+        circuits = [self]
+        for name in names:
+            circuits = [child for circuit in circuits
+                        for child in circuit.matching_children(name)]
+        return [pin for circuit in circuits for pin in circuit.inputs + circuit.outputs
+                if fnmatchcase('{} {}'.format(pin.kind, pin.index), pin_pattern)]
+
+    def matching_children(self, pattern):
+        if not any(char in pattern for char in '*?['):
+            child = self.children.get(pattern)
+            return [] if child is None else [child]
+        return [child for name, child in self.children.items()
+                if fnmatchcase(name, pattern)]
+
+    def find_pins_with_prefix(self, prefix):
+        # pins whose relative path starts with prefix, like 'oneBitAdder1'
+        # (also the pins of oneBitAdder10...) or 'oneBitAdder1/xor2/'
+        *names, start = prefix.split('/')
+        circuit = self
+        for name in names:
+            circuit = getattr(circuit, 'children', {}).get(name)
+            if circuit is None:
+                return []
+        pins = [pin for pin in circuit.inputs + circuit.outputs
+                if '{} {}'.format(pin.kind, pin.index).startswith(start)]
+        for name, child in getattr(circuit, 'children', {}).items():
+            if name.startswith(start):
+                pins += child.pins()
+        return pins
+
+    # override
+    def __deepcopy__(self, memo):
+        # the pins are copied first without their circuit and observers,
+        # set at the end, so that copying does not recurse along the
+        # connections, too deep for the carry chain of a wide adder
+        pins = [pin for pin in self.pins() if id(pin) not in memo]
+        for pin in pins:
+            pin_copy = memo[id(pin)] = object.__new__(Pin)
+            for attribute in ('own_name', 'kind', 'index', 'state'):
+                setattr(pin_copy, attribute, getattr(pin, attribute))
+        copy = super().__deepcopy__(memo)
+        for circuit in copy.circuits:
+            circuit.parent = copy
+        for pin in pins:
+            pin_copy = memo[id(pin)]
+            pin_copy.circuit = deepcopy(pin.circuit, memo)
+            pin_copy.observers = ({deepcopy(observer, memo): None for observer in pin.observers}
+                                  if pin.observers else ())
+        return copy
+
+
+class OscillationError(Exception):
+    pass
+
+
+def strongly_connected_components(nodes, successors):
+    # Tarjan's algorithm without recursion. Returns lists of nodes, each
+    # after the components it can reach.
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+    for root in nodes:
+        if root in index:
+            continue
+        work = [(root, iter(successors[root]))]
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(successors[child])))
+                    break
+                if child in on_stack:
+                    low[node] = min(low[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        component.append(member)
+                        if member is node:
+                            break
+                    components.append(component)
+    return components
+
+
+class Observable(ABC):
+    __slots__ = ('observers',)
+
+    def __init__(self):
+        # a dict used as a set that keeps the order of insertion, so that
+        # adding and removing are O(1) and observers are notified in the
+        # order they were added. Made by the first add_observer(): until
+        # then, and when the last one is removed, the empty tuple shared by
+        # all, so that pins without observers take no memory for them.
+        self.observers = ()
+
+    def add_observer(self, observer):
+        if not self.observers:
+            self.observers = {}
+        self.observers[observer] = None
+
+    def remove_observer(self, observer):
+        assert observer in self.observers
+        del self.observers[observer]
+        if not self.observers:
+            self.observers = ()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('%s does not observe anymore %s', observer.name, self.name,
+                         extra={'event': 'disconnect', 'pin_from': self.path(),
+                                'pin_to': observer.path()})
+
+    def notify_observers(self, an_object=None):
+        for obs in self.observers:
+            obs.update(self, an_object)
+            # observable sends itself to each observer
+
+
+class Observer(ABC):
+    __slots__ = ()
+
+    def update(self, observable, an_object):
+        raise NotImplementedError
+        # abstract method
+
+
+class Pin(Observable, Observer):
+    __slots__ = ('own_name', 'circuit', 'kind', 'index', 'state')
+    # called as notification_hook(pin, observer) before each notification,
+    # set by an active Profiler
+    notification_hook = None
+
+    def __init__(self, name, circuit=None, kind=None, index=None):
+        super().__init__()
+        self.own_name = name
+        self.circuit = circuit
+        self.kind = kind # 'input' or 'output' of circuit, at index
+        self.index = index
+        self.state = None
+
+    @property
+    def name(self):
+        # made on request, not stored, for the pins of a circuit
+        if self.own_name is None:
+            return '{} {} of {}'.format(self.kind, self.index, self.circuit.name)
+        return self.own_name
+
+    @name.setter
+    def name(self, name):
+        self.own_name = name
+
+    def path(self):
+        # like 'oneBitAdder7/xor2/and1/input 1'
+        if self.circuit is None:
+            return self.name
+        return '{}/{} {}'.format(self.circuit.path(), self.kind, self.index)
+
+    # override
+    def add_observer(self, observer):
+        super().add_observer(observer)
+        self.connection_changed(observer)
+
+    # override
+    def remove_observer(self, observer):
+        super().remove_observer(observer)
+        self.connection_changed(observer)
+
+    def connection_changed(self, observer):
+        # the components that contain the circuit of either pin
+        for pin in (self, observer):
+            circuit = getattr(pin, 'circuit', None)
+            if circuit is not None:
+                circuit.changed()
+
+    def is_state(self):
+        return self.state
+
+    def set_state(self, new_state):
+        self.state = new_state
+        self.notify_observers(self)
+
+    # override
+    def notify_observers(self, an_object=None):
+        # Same as update() -> set_state() -> notify_observers() on every pin
+        # observer, in the same depth-first order, but with a stack of
+        # iterators instead of recursion, so that long chains of pins do not
+        # reach the recursion limit. Other observers get update() as usual.
+        hook = self.notification_hook
+        stack = [(self, iter(self.observers), an_object)]
+        while stack:
+            pin, observers, an_object = stack[-1]
+            for observer in observers:
+                if hook is not None:
+                    hook(pin, observer)
+                if type(observer) is Pin:
+                    observer.state = pin.state
+                    stack.append((observer, iter(observer.observers), observer))
+                    break
+                observer.update(pin, an_object)
+            else:
+                stack.pop()
+
+    def update(self, observed_pin, an_object):
+        self.set_state(observed_pin.is_state())
+
+    def __str__(self):
+        str = self.name
+        if len(self.observers) > 0:
+            str += ' observed by'
+            for obs in self.observers:
+                str += ' ' + obs.name + ' '
+        return str
+
+
+class Connection:
+    def __init__(self, pin_from, pin_to):
+        pin_from.add_observer(pin_to)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('%s is observer of %s', pin_to.name, pin_from.name,
+                         extra={'event': 'connect', 'pin_from': pin_from.path(),
+                                'pin_to': pin_to.path()})
+
+
+class JsonLinesFormatter(logging.Formatter):
+    # one JSON object per line, with the pins of connection records
+    def format(self, record):
+        line = {'level': record.levelname, 'message': record.getMessage()}
+        for attribute in ('event', 'pin_from', 'pin_to'):
+            if hasattr(record, attribute):
+                line[attribute] = getattr(record, attribute)
+        return json.dumps(line)
+
+
+def log_connections(file_name, capacity=1024, level=logging.DEBUG):
+    # Writes every connection made or removed to file_name as JSON lines,
+    # capacity records at a time, and not to the handlers of the parent
+    # loggers. Returns a function that stops it: it writes the records left,
+    # closes the file and restores the logger.
+    target = logging.FileHandler(file_name, mode='w')
+    target.setFormatter(JsonLinesFormatter())
+    handler = logging.handlers.MemoryHandler(capacity, logging.CRITICAL, target)
+    old_level, old_propagate = logger.level, logger.propagate
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+    def stop():
+        logger.removeHandler(handler)
+        logger.setLevel(old_level)
+        logger.propagate = old_propagate
+        handler.close() # flushes the records to target
+        target.close()
+    return stop
+
+
+def circuit_classes():
+    # Circuit and all its subclasses, defined here or elsewhere
+    classes = [Circuit]
+    for cls in classes:
+        classes += cls.__subclasses__()
+    return classes
+
+
+class Hierarchy:
+    # Names of the pins of a compiled circuit, kept per circuit instead of
+    # per pin: the path of each circuit, where its pins start in pin_nets and
+    # how many of them are inputs. Pin names are made on request.
+    def __init__(self, paths, pin_start, num_inputs, pin_nets):
+        self.paths = paths
+        self.pin_start = pin_start
+        self.num_inputs = num_inputs
+        self.pin_nets = pin_nets
+        self.circuit_index = None
+
+    def pin_name(self, pin):
+        c = bisect.bisect_right(self.pin_start, pin) - 1
+        index = pin - self.pin_start[c]
+        if index < self.num_inputs[c]:
+            return '{}/input {}'.format(self.paths[c], index)
+        return '{}/output {}'.format(self.paths[c], index - self.num_inputs[c])
+
+    def names(self, net):
+        return [self.pin_name(pin) for pin, pin_net in enumerate(self.pin_nets)
+                if pin_net == net]
+
+    def net(self, name):
+        if self.circuit_index is None:
+            self.circuit_index = {path: c for c, path in enumerate(self.paths)}
+        path, pin_name = name.rsplit('/', 1)
+        kind, index = pin_name.split(' ')
+        c = self.circuit_index[path]
+        index = int(index)
+        if kind == 'output':
+            index += self.num_inputs[c]
+        assert 0 <= index < self.pin_start[c + 1] - self.pin_start[c], name
+        return self.pin_nets[self.pin_start[c] + index]
+
+
+class CompiledCircuit:
+    # Flat version of a Component: pins joined by connections become one net
+    # with an integer id, and the primitive circuits become gates sorted by
+    # level, so that a single pass over them evaluates the whole component.
+    # Everything is kept in arrays: the state of net i is nets[i], and gate g
+    # is the cell cells[kinds[g]] with input nets
+    # fanin[fanin_start[g]:fanin_start[g + 1]] and output net gate_outputs[g].
+    # Flip-flops and clocks are not gates: their outputs are sources of the
+    # combinational logic, and registers lists the (data net, output net) of
+    # the flip-flops, for cycle simulation. They must all be clocked by
+    # clock_net, the output of the only Clock or an input, -1 if there are
+    # no flip-flops. Feedback loops of gates, like a latch made of gates,
+    # can not be levelized: Component.process() settles them, but compiling
+    # them raises ValueError, the state of a compiled circuit is kept only
+    # by flip-flops.
+    def __init__(self, name, num_nets, gates, input_nets, output_nets,
+                 hierarchy=None, registers=(), clock_net=-1):
+        self.name = name
+        self.num_nets = num_nets
+        self.input_nets = array('i', input_nets)
+        self.output_nets = array('i', output_nets)
+        self.hierarchy = hierarchy
+        self.registers = list(registers)
+        self.clock_net = clock_net
+        self.pin_net = {}
+        self.buses = {} # name -> CompiledBus
+        self.definitions = {} # definition of instances -> its compiled circuit spliced
+        self.mapped = None # the memory map of a loaded netlist file
+        self.views = [] # of mapped
+        gates, levels = self.levelize(num_nets, gates)
+        self.num_gates = len(gates)
+        self.levels = array('i', levels)
+        self.cells = []
+        cell_kinds = {}
+        self.kinds = bytearray(self.num_gates)
+        self.fanin = array('i')
+        self.fanin_start = array('i', [0])
+        for g, (cell, ins, out) in enumerate(gates):
+            if cell not in cell_kinds:
+                cell_kinds[cell] = len(self.cells)
+                self.cells.append(cell)
+            self.kinds[g] = cell_kinds[cell]
+            self.fanin.extend(ins)
+            self.fanin_start.append(len(self.fanin))
+        self.gate_outputs = array('i', [out for cell, ins, out in gates])
+        # the gates fed by net i are fanout[fanout_start[i]:fanout_start[i + 1]]
+        fanout_count = array('i', bytes(4 * (num_nets + 1)))
+        gate_fanin = [set(ins) for cell, ins, out in gates]
+        for ins in gate_fanin:
+            for net in ins:
+                fanout_count[net + 1] += 1
+        self.fanout_start = array('i', itertools.accumulate(fanout_count))
+        self.fanout = array('i', bytes(4 * self.fanout_start[-1]))
+        position = self.fanout_start[:-1]
+        for g, ins in enumerate(gate_fanin):
+            for net in ins:
+                self.fanout[position[net]] = g
+                position[net] += 1
+        self.nets = bytearray(num_nets)
+        # gates waiting to be evaluated by propagate(), all of them at first
+        self.pending = list(range(self.num_gates))
+        self.queued = bytearray([1]) * self.num_gates
+
+    @staticmethod
+    def levelize(num_nets, gates):
+        driver = [None] * num_nets
+        for g, (cell, ins, out) in enumerate(gates):
+            if driver[out] is not None:
+                raise ValueError('net {} has two drivers'.format(out))
+            driver[out] = g
+        fanout = [[] for _ in gates]
+        num_fanin = [0] * len(gates)
+        for g, (cell, ins, out) in enumerate(gates):
+            for net in ins:
+                if driver[net] is not None:
+                    fanout[driver[net]].append(g)
+                    num_fanin[g] += 1
+        level = [0] * len(gates)
+        ready = [g for g in range(len(gates)) if num_fanin[g] == 0]
+        order = []
+        while ready:
+            g = ready.pop()
+            order.append(g)
+            for f in fanout[g]:
+                level[f] = max(level[f], level[g] + 1)
+                num_fanin[f] -= 1
+                if num_fanin[f] == 0:
+                    ready.append(f)
+        if len(order) < len(gates):
+            raise ValueError('combinational loop, can not levelize, use flip-flops '
+                             'instead of latches made of gates')
+        order.sort(key=lambda g: level[g])
+        return [gates[g] for g in order], [level[g] for g in order]
+
+    @classmethod
+    def from_component(cls, component, keep_pins=True):
+        # keep_pins=False does not keep references to the pins, so that the
+        # component can be freed and only the compact arrays remain
+        parent = {} # union-find of pins, the root of a set is its net
+        pins = []
+        paths = []
+        pin_start = array('i')
+        num_inputs = array('i')
+        gates = []
+        # nets of the compiled definitions of instances, as (instance, net)
+        instance_nets = []
+        definitions = {}
+        registers = [] # (data, output) of flip-flops
+        clock_pins = [] # of the flip-flops
+        clocks = [] # outputs of clocks
+        initial_states = [] # (output of a flip-flop or clock, state)
+
+        def find(pin):
+            while parent[pin] is not pin:
+                parent[pin] = parent[parent[pin]]
+                pin = parent[pin]
+            return pin
+
+        def visit(circuit, path):
+            path += circuit.name
+            paths.append(path)
+            pin_start.append(len(pins))
+            num_inputs.append(len(circuit.inputs))
+            for pin in circuit.inputs + circuit.outputs:
+                parent[pin] = pin
+                pins.append(pin)
+            if isinstance(circuit, Component):
+                for sub_circuit in circuit.circuits:
+                    visit(sub_circuit, path + '/')
+            elif isinstance(circuit, Instance):
+                definitions[circuit.definition] = circuit.definition.compile()
+                splice(circuit, definitions[circuit.definition])
+            elif circuit.sequential:
+                if circuit.inputs:
+                    registers.append((circuit.inputs[0], circuit.outputs[0]))
+                    clock_pins.append(circuit.inputs[1])
+                else:
+                    clocks.append(circuit.outputs[0])
+                initial_states.append((circuit.outputs[0], circuit.state))
+            else:
+                assert len(circuit.outputs) == 1
+                gates.append((type(circuit), circuit.inputs, circuit.outputs[0]))
+
+        def splice(instance, compiled):
+            # the gates of the definition, on nets of their own
+            nets = [(instance, net) for net in range(compiled.num_nets)]
+            for net in nets:
+                parent[net] = net
+            instance_nets.extend(nets)
+            for pin, net in zip(instance.inputs, compiled.input_nets):
+                parent[find(nets[net])] = find(pin)
+            for pin, net in zip(instance.outputs, compiled.output_nets):
+                parent[find(pin)] = find(nets[net])
+            for g in range(compiled.num_gates):
+                cell, ins, out = compiled.gate(g)
+                gates.append((cell, [nets[net] for net in ins], nets[out]))
+            states = instance.nets or compiled.nets
+            for d, q in compiled.registers:
+                registers.append((nets[d], nets[q]))
+                clock_pins.append(nets[compiled.clock_net])
+                initial_states.append((nets[q], states[q]))
+            if compiled.registers and compiled.clock_net not in compiled.input_nets:
+                clocks.append(nets[compiled.clock_net]) # a clock of the definition
+
+        visit(component, '')
+        pin_start.append(len(pins))
+        for pin in pins:
+            for observer in pin.observers:
+                if observer in parent:
+                    parent[find(observer)] = find(pin)
+        # top level inputs get the first net ids, in order
+        root_net = {}
+        pin_nets = array('i', [root_net.setdefault(find(pin), len(root_net))
+                               for pin in pins])
+        pin_net = dict(zip(pins, pin_nets))
+        node_net = dict(pin_net)
+        for net in instance_nets:
+            node_net[net] = root_net.setdefault(find(net), len(root_net))
+        input_nets = [pin_net[pin] for pin in component.inputs]
+        clock_nets = {node_net[pin] for pin in clock_pins}
+        if len(clock_nets) > 1:
+            raise ValueError('the flip-flops of {} have more than one clock'.format(
+                component.name))
+        clock_net = clock_nets.pop() if clock_nets else -1
+        if clock_net >= 0 and clock_net not in input_nets and \
+                clock_net not in {node_net[node] for node in clocks}:
+            raise ValueError('the flip-flops of {} are not clocked by a Clock or an '
+                             'input'.format(component.name))
+        compiled = cls(component.name, len(root_net),
+                       [(cell, [node_net[node] for node in ins], node_net[out])
+                        for cell, ins, out in gates],
+                       input_nets, [pin_net[pin] for pin in component.outputs],
+                       Hierarchy(paths, pin_start, num_inputs, pin_nets),
+                       [(node_net[d], node_net[q]) for d, q in registers], clock_net)
+        compiled.definitions = definitions
+        if keep_pins:
+            compiled.pin_net = pin_net
+        for name, bus in (component.buses or {}).items():
+            compiled.buses[name] = CompiledBus(compiled, [pin_net[pin] for pin in bus.pins])
+        for node, state in initial_states:
+            compiled.nets[node_net[node]] = state
+        return compiled
+
+    # netlist files: a header with the offset and length of each section,
+    # then the sections, the arrays of a compiled circuit in native byte order
+    netlist_magic = b'NETL'
+    netlist_version = 2
+    netlist_sections = [('kinds', 'B'), ('levels', 'i'), ('fanin', 'i'),
+                        ('fanin_start', 'i'), ('gate_outputs', 'i'), ('fanout', 'i'),
+                        ('fanout_start', 'i'), ('input_nets', 'i'), ('output_nets', 'i'),
+                        ('registers', 'i'), ('nets', 'B'), ('pin_start', 'i'),
+                        ('num_inputs', 'i'), ('pin_nets', 'i'), ('bus_start', 'i'),
+                        ('bus_nets', 'i'), ('strings', 'B'), ('string_start', 'i')]
+    # magic, version, 0x01020304 to check the byte order, number of cells,
+    # and (offset, length) of each section
+    netlist_header = struct.Struct('=4s3I' + 'II' * len(netlist_sections))
+
+    def save(self, file_name):
+        # The string table has the name of the circuit, the class names of
+        # the cells, the paths of the hierarchy and the names of the buses
+        hierarchy = self.hierarchy or Hierarchy([], [0], [], [])
+        strings = [string.encode() for string in itertools.chain(
+            [self.name], [cell.__name__ for cell in self.cells],
+            hierarchy.paths, self.buses)]
+        buses = self.buses.values()
+        sections = {
+            'kinds': self.kinds, 'levels': self.levels, 'fanin': self.fanin,
+            'fanin_start': self.fanin_start, 'gate_outputs': self.gate_outputs,
+            'fanout': self.fanout, 'fanout_start': self.fanout_start,
+            'input_nets': self.input_nets, 'output_nets': self.output_nets,
+            'registers': itertools.chain(*self.registers, [self.clock_net]),
+            'nets': self.nets, 'pin_start': hierarchy.pin_start,
+            'num_inputs': hierarchy.num_inputs, 'pin_nets': hierarchy.pin_nets,
+            'bus_start': itertools.accumulate([len(bus) for bus in buses], initial=0),
+            'bus_nets': itertools.chain.from_iterable(bus.nets for bus in buses),
+            'strings': b''.join(strings),
+            'string_start': itertools.accumulate([len(string) for string in strings], initial=0),
+        }
+        places = []
+        datas = []
+        offset = self.netlist_header.size
+        for name, code in self.netlist_sections:
+            section = array(code, sections[name])
+            data = section.tobytes() + bytes(-len(section) * section.itemsize % 4)
+            places += [offset, len(section)]
+            datas.append(data)
+            offset += len(data)
+        with open(file_name, 'wb') as file:
+            file.write(self.netlist_header.pack(self.netlist_magic, self.netlist_version,
+                                                0x01020304, len(self.cells), *places))
+            file.writelines(datas)
+
+    @classmethod
+    def load(cls, file_name):
+        # A compiled circuit whose arrays are read-only views of the netlist
+        # file mapped in memory, so loading does not depend on its size and
+        # the processes that load the same file share one copy. Only the net
+        # states are copied. Cells are found by class name. Use it in a with
+        # statement, or call close(), to release the memory map.
+        with open(file_name, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        magic, version, byte_order, num_cells, *places = cls.netlist_header.unpack_from(view)
+        if magic != cls.netlist_magic or version != cls.netlist_version:
+            raise ValueError('{} is not a netlist file of version {}'.format(
+                file_name, cls.netlist_version))
+        if byte_order != 0x01020304:
+            raise ValueError('{} has another byte order'.format(file_name))
+        sections = {}
+        for (name, code), offset, length in zip(cls.netlist_sections, places[0::2], places[1::2]):
+            sections[name] = view[offset:offset + array(code).itemsize * length].cast(code)
+        string_start = sections['string_start']
+        strings = [bytes(sections['strings'][start:end]).decode()
+                   for start, end in zip(string_start, string_start[1:])]
+        name = strings[0]
+        cell_names = strings[1:1 + num_cells]
+        paths = strings[1 + num_cells:1 + num_cells + len(sections['num_inputs'])]
+        bus_names = strings[1 + num_cells + len(paths):]
+        cells = {cell.__name__: cell for cell in circuit_classes()}
+        for cell_name in cell_names:
+            if cell_name not in cells:
+                raise ValueError('{} has an unknown cell {}'.format(file_name, cell_name))
+        compiled = object.__new__(cls)
+        compiled.name = name
+        compiled.nets = bytearray(sections['nets'])
+        compiled.num_nets = len(compiled.nets)
+        compiled.num_gates = len(sections['kinds'])
+        for name in ['kinds', 'levels', 'fanin', 'fanin_start', 'gate_outputs',
+                     'fanout', 'fanout_start', 'input_nets', 'output_nets']:
+            setattr(compiled, name, sections[name])
+        compiled.cells = [cells[cell_name] for cell_name in cell_names]
+        registers = sections['registers']
+        compiled.registers = list(zip(registers[0:-1:2], registers[1:-1:2]))
+        compiled.clock_net = registers[-1]
+        compiled.hierarchy = None
+        if paths:
+            compiled.hierarchy = Hierarchy(paths, sections['pin_start'],
+                                           sections['num_inputs'], sections['pin_nets'])
+        compiled.pin_net = {}
+        compiled.buses = {}
+        compiled.definitions = {}
+        bus_start = sections['bus_start']
+        for bus_name, start, end in zip(bus_names, bus_start, bus_start[1:]):
+            compiled.buses[bus_name] = CompiledBus(compiled, sections['bus_nets'][start:end])
+        compiled.pending = list(range(compiled.num_gates))
+        compiled.queued = bytearray([1]) * compiled.num_gates
+        compiled.mapped = mapped
+        compiled.views = [view] + list(sections.values())
+        return compiled
+
+    def close(self):
+        # Releases the memory map of a loaded circuit, that can not be used
+        # anymore. Deleting the circuit is not enough: its buses refer to it,
+        # so it is freed only by the garbage collector.
+        for view in self.views:
+            view.release()
+        self.views = []
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def net(self, pin_or_name):
+        if isinstance(pin_or_name, Pin):
+            return self.pin_net[pin_or_name]
+        return self.hierarchy.net(pin_or_name)
+
+    def bus(self, name):
+        return self.buses[name]
+
+    def gate(self, g):
+        # (cell, input nets, output net) of gate g
+        return (self.cells[self.kinds[g]],
+                self.fanin[self.fanin_start[g]:self.fanin_start[g + 1]],
+                self.gate_outputs[g])
+
+    def set_input(self, num_input, state):
+        net = self.input_nets[num_input]
+        if self.nets[net] != state:
+            self.nets[net] = state
+            self.schedule(net)
+
+    def get_output(self, num_output):
+        return bool(self.nets[self.output_nets[num_output]])
+
+    def process(self, nets=None):
+        # nets=None evaluates the states of this circuit, otherwise the
+        # bytearray nets of an instance of it
+        if nets is None:
+            nets = self.nets
+            self.pending = []
+            self.queued = bytearray(self.num_gates)
+        fanin = self.fanin
+        functions = [cell.bit_function for cell in self.cells]
+        state = nets.__getitem__
+        for kind, out, start, end in zip(self.kinds, self.gate_outputs,
+                                         self.fanin_start, self.fanin_start[1:]):
+            nets[out] = functions[kind](map(state, fanin[start:end]))
+
+    def schedule(self, net):
+        queued = self.queued
+        for g in self.fanout[self.fanout_start[net]:self.fanout_start[net + 1]]:
+            if not queued[g]:
+                queued[g] = 1
+                heapq.heappush(self.pending, g)
+
+    def propagate(self):
+        # Event-driven alternative to process(): only the gates fed by nets
+        # that changed since the last call are evaluated, in level order so
+        # that each one is evaluated at most once, and a gate whose output
+        # does not change stops the propagation. Returns the number of
+        # gates evaluated.
+        nets = self.nets
+        fanin = self.fanin
+        fanin_start = self.fanin_start
+        functions = [cell.bit_function for cell in self.cells]
+        state = nets.__getitem__
+        pending = self.pending
+        queued = self.queued
+        num_evaluated = 0
+        while pending:
+            g = heapq.heappop(pending)
+            queued[g] = 0
+            out = self.gate_outputs[g]
+            new_state = functions[self.kinds[g]](
+                map(state, fanin[fanin_start[g]:fanin_start[g + 1]]))
+            num_evaluated += 1
+            if new_state != nets[out]:
+                nets[out] = new_state
+                self.schedule(out)
+        return num_evaluated
+
+    def latch(self):
+        # the clock edge: every register takes the state of its data net
+        nets = self.nets
+        states = [nets[d] for d, q in self.registers]
+        for (d, q), state in zip(self.registers, states):
+            if nets[q] != state:
+                nets[q] = state
+                self.schedule(q)
+
+    def step(self):
+        self.propagate()
+        self.latch()
+
+    def evaluate(self, states):
+        for num_input, state in enumerate(states):
+            self.set_input(num_input, state)
+        self.process()
+        return [bool(self.nets[net]) for net in self.output_nets]
+
+    def evaluate_packed(self, words, width=None):
+        # Bit-parallel evaluation: words[k] holds input k of many vectors,
+        # one vector per bit. Words are Python ints of width bits, or NumPy
+        # arrays of unsigned ints or bools, where every bit is used.
+        if np is not None and isinstance(words[0], np.ndarray):
+            mask = np.invert(np.zeros(1, dtype=words[0].dtype))[0]
+        else:
+            mask = (1 << width) - 1
+        nets = [0] * self.num_nets
+        for net, word in zip(self.input_nets, words):
+            nets[net] = word
+        fanin = self.fanin
+        functions = [cell.packed_function for cell in self.cells]
+        for kind, out, start, end in zip(self.kinds, self.gate_outputs,
+                                         self.fanin_start, self.fanin_start[1:]):
+            nets[out] = functions[kind]([nets[net] for net in fanin[start:end]], mask)
+        return [nets[net] for net in self.output_nets]
+
+    def exhaustive(self, batch=2**16):
+        # yields (first vector, number of vectors, output words) for all the
+        # 2**num_inputs input vectors, batch vectors at a time
+        num_vectors = 2 ** len(self.input_nets)
+        for start in range(0, num_vectors, batch):
+            count = min(batch, num_vectors - start)
+            words = exhaustive_words(len(self.input_nets), start, count)
+            yield start, count, self.evaluate_packed(words, count)
+
+
+class CompiledBus:
+    # A bus of a compiled circuit. The inputs and then the outputs of the
+    # compiled component have consecutive net ids, so a bus of them is a
+    # slice of the net states, read and written with one bytes operation.
+    to_states = bytes.maketrans(b'01', b'\x00\x01')
+    to_digits = bytes.maketrans(b'\x00\x01', b'01')
+
+    def __init__(self, compiled, nets):
+        self.compiled = compiled
+        self.nets = array('i', nets)
+        self.start = None # first net, if consecutive
+        if nets and list(nets) == list(range(nets[0], nets[0] + len(nets))):
+            self.start = nets[0]
+
+    def __len__(self):
+        return len(self.nets)
+
+    def set_value(self, value):
+        width = len(self.nets)
+        nets = self.compiled.nets
+        if self.start is None:
+            for k, net in enumerate(self.nets):
+                if nets[net] != value >> k & 1:
+                    nets[net] = value >> k & 1
+                    self.compiled.schedule(net)
+            return
+        states = format(value & ((1 << width) - 1), '0{}b'.format(width))[::-1]
+        states = states.encode().translate(self.to_states)
+        end = self.start + width
+        old_states = nets[self.start:end]
+        if old_states != states:
+            nets[self.start:end] = states
+            for k in range(width):
+                if old_states[k] != states[k]:
+                    self.compiled.schedule(self.start + k)
+
+    def value(self):
+        nets = self.compiled.nets
+        if self.start is None:
+            return sum(nets[net] << k for k, net in enumerate(self.nets))
+        digits = nets[self.start:self.start + len(self.nets)].translate(self.to_digits)
+        return int(digits[::-1] or b'0', 2)
+
+
+class CycleSimulator:
+    # Cycle-based simulation of a component with flip-flops: each cycle
+    # settles the combinational logic once, event-driven, records the
+    # probes, and clocks all the registers.
+    def __init__(self, component, probes):
+        self.compiled = component.compile()
+        if self.compiled.clock_net in self.compiled.input_nets:
+            raise ValueError('the flip-flops of {} are clocked by an input, not by a '
+                             'Clock'.format(component.name))
+        self.probe_nets = [self.compiled.net(probe) for probe in probes]
+
+    def run(self, num_cycles):
+        # returns a bytearray with the state of probe k at cycle c in
+        # position c * number of probes + k
+        compiled = self.compiled
+        nets = compiled.nets
+        probe_nets = self.probe_nets
+        width = len(probe_nets)
+        trace = bytearray(num_cycles * width)
+        for cycle in range(0, num_cycles * width, width):
+            compiled.propagate()
+            trace[cycle:cycle + width] = bytes(1 if nets[net] else 0 for net in probe_nets)
+            compiled.latch()
+        return trace
+
+
+class CircuitStats:
+    def __init__(self):
+        self.calls = 0 # of process()
+        self.seconds = 0.0 # in process(), with the circuits inside
+        self.self_seconds = 0.0 # in process(), without the circuits inside
+        self.state_changes = 0 # of its pins
+        self.notifications = 0 # sent by its pins to their observers
+
+
+class Profiler:
+    # Counts, while active, the process() calls, state changes and
+    # notifications of each circuit, by path, and times process():
+    #     with Profiler() as profiler:
+    #         component.process()
+    #     print(profiler.table())
+    # The methods are replaced by instrumented ones only while the profiler
+    # is active, so it costs nothing otherwise.
+    def __init__(self):
+        self.stats = {} # path -> CircuitStats
+        self.paths = {} # circuit -> path
+        self.children_seconds = [] # of the process() calls running
+        self.originals = []
+
+    def stats_of(self, circuit):
+        path = self.paths.get(circuit)
+        if path is None:
+            path = self.paths[circuit] = circuit.path()
+        stats = self.stats.get(path)
+        if stats is None:
+            stats = self.stats[path] = CircuitStats()
+        return stats
+
+    def stats_of_pin(self, pin):
+        if pin.circuit is None:
+            return self.stats.setdefault(pin.name, CircuitStats())
+        return self.stats_of(pin.circuit)
+
+    def __enter__(self):
+        for cls in circuit_classes():
+            if 'process' in vars(cls):
+                self.replace(cls, 'process', self.timed(vars(cls)['process']))
+        self.replace(Pin, 'set_state', self.counted_set_state)
+        self.replace(Pin, 'notification_hook', self.count_notification)
+        return self
+
+    def __exit__(self, *exception):
+        for cls, name, original in reversed(self.originals):
+            setattr(cls, name, original)
+        self.originals = []
+
+    def replace(self, cls, name, method):
+        self.originals.append((cls, name, vars(cls)[name]))
+        setattr(cls, name, method)
+
+    def timed(self, process):
+        profiler = self
+
+        def timed_process(circuit):
+            stats = profiler.stats_of(circuit)
+            profiler.children_seconds.append(0.0)
+            start = time.perf_counter()
+            try:
+                process(circuit)
+            finally:
+                seconds = time.perf_counter() - start
+                stats.calls += 1
+                stats.seconds += seconds
+                stats.self_seconds += seconds - profiler.children_seconds.pop()
+                if profiler.children_seconds:
+                    profiler.children_seconds[-1] += seconds
+        return timed_process
+
+    @property
+    def counted_set_state(self):
+        profiler = self
+
+        def set_state(pin, new_state):
+            if pin.state != new_state:
+                profiler.stats_of_pin(pin).state_changes += 1
+            pin.state = new_state
+            pin.notify_observers(pin)
+        return set_state
+
+    def count_notification(self, pin, observer):
+        # a pin observer takes the state of pin without set_state()
+        self.stats_of_pin(pin).notifications += 1
+        if type(observer) is Pin and observer.state != pin.state:
+            self.stats_of_pin(observer).state_changes += 1
+
+    def levels(self):
+        # the stats added up per level of the hierarchy, 0 the top
+        levels = {}
+        for path, stats in self.stats.items():
+            total = levels.setdefault(path.count('/'), CircuitStats())
+            total.calls += stats.calls
+            total.seconds += stats.seconds
+            total.self_seconds += stats.self_seconds
+            total.state_changes += stats.state_changes
+            total.notifications += stats.notifications
+        return levels
+
+    def table(self, top=None):
+        # the circuits that took more time first
+        lines = ['{:>8} {:>10} {:>10} {:>8} {:>8}  {}'.format(
+            'calls', 'ms', 'self ms', 'changes', 'notif.', 'circuit')]
+        rows = sorted(self.stats.items(), key=lambda item: -item[1].seconds)
+        for path, stats in rows[:top]:
+            lines.append('{:>8} {:>10.3f} {:>10.3f} {:>8} {:>8}  {}'.format(
+                stats.calls, 1000 * stats.seconds, 1000 * stats.self_seconds,
+                stats.state_changes, stats.notifications, path))
+        return '\n'.join(lines)
+
+    def write_flamegraph(self, file_name):
+        # collapsed stacks, the input of flamegraph.pl and speedscope, with
+        # the self time in microseconds
+        with open(file_name, 'w') as file:
+            for path, stats in self.stats.items():
+                if stats.calls:
+                    file.write('{} {}\n'.format(path.replace('/', ';'),
+                                                round(1e6 * stats.self_seconds)))
+
+
+class VerificationReport:
+    def __init__(self, num_vectors, mismatches, seconds):
+        self.num_vectors = num_vectors
+        self.mismatches = mismatches # (vector, expected, result)
+        self.seconds = seconds
+
+    def vectors_per_second(self):
+        return self.num_vectors / self.seconds if self.seconds else float('inf')
+
+    def __str__(self):
+        return '{} vectors, {} mismatches, {:.0f} vectors/s'.format(
+            self.num_vectors, len(self.mismatches), self.vectors_per_second())
+
+
+def verify(component, reference, input_space, workers=None, shard_size=2**16,
+           max_mismatches=100, time_budget=None):
+    # Checks that for every vector v of input_space, an int with bit k the
+    # state of input k, the outputs of component as an int with bit k the
+    # state of output k are reference(v). input_space is split in shards of
+    # shard_size vectors evaluated bit-parallel by a pool of workers
+    # processes (workers=0 evaluates them in this process, as does a system
+    # without fork, so that the script is not run again by every worker).
+    # input_space can be endless, like Stimulus.random(), with a time_budget
+    # in seconds after which no more shards are started.
+    compiled = component if isinstance(component, CompiledCircuit) else component.compile()
+    start_time = time.perf_counter()
+    if isinstance(input_space, range):
+        shards = (input_space[i:i + shard_size]
+                  for i in range(0, len(input_space), shard_size))
+    else:
+        vectors = iter(input_space)
+        shards = iter(lambda: list(itertools.islice(vectors, shard_size)), [])
+    if time_budget is not None:
+        deadline = start_time + time_budget
+        shards = itertools.takewhile(lambda shard: time.perf_counter() < deadline, shards)
+    num_vectors = 0
+    mismatches = []
+    if workers == 0 or 'fork' not in multiprocessing.get_all_start_methods():
+        start_verifier(compiled, reference, max_mismatches)
+        results = map(verify_shard, shards)
+        pool = None
+    else:
+        workers = workers or os.cpu_count() or 1
+        pool = ProcessPoolExecutor(workers, multiprocessing.get_context('fork'),
+                                   start_verifier, (compiled, reference, max_mismatches))
+        results = bounded_map(pool, verify_shard, shards, 2 * workers)
+    try:
+        for shard_vectors, shard_mismatches in results:
+            num_vectors += shard_vectors
+            mismatches += shard_mismatches[:max_mismatches - len(mismatches)]
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return VerificationReport(num_vectors, mismatches, time.perf_counter() - start_time)
+
+
+def bounded_map(pool, function, iterable, size):
+    # like pool.map(), but submitting only size tasks ahead, so that the
+    # iterable can be endless
+    futures = deque()
+    for item in iterable:
+        futures.append(pool.submit(function, item))
+        if len(futures) == size:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+verifier = None # (compiled circuit, reference, max mismatches) of this process
+
+
+def start_verifier(compiled, reference, max_mismatches):
+    global verifier
+    verifier = (compiled, reference, max_mismatches)
+
+
+def verify_shard(vectors):
+    compiled, reference, max_mismatches = verifier
+    num_inputs = len(compiled.input_nets)
+    if isinstance(vectors, range) and vectors.step == 1:
+        words = exhaustive_words(num_inputs, vectors.start, len(vectors))
+    else:
+        words = pack_vectors(vectors, num_inputs)
+    results = unpack_words(compiled.evaluate_packed(words, len(vectors)), len(vectors))
+    mismatches = []
+    for vector, result in zip(vectors, results):
+        expected = reference(vector)
+        if result != expected:
+            mismatches.append((vector, expected, result))
+            if len(mismatches) == max_mismatches:
+                break
+    return len(vectors), mismatches
+
+
+class Stimulus:
+    # Input vectors for verify() when the inputs are too many to try them
+    # all. The inputs are split in fields of the given number of bits, like
+    # [n, n, 1] for A, B and the carry in of an n-bits adder, field 0 in the
+    # lowest bits. The same seed gives the same vectors, to reproduce a failure.
+    def __init__(self, fields, seed=0):
+        self.fields = fields
+        self.num_bits = sum(fields)
+        self.seed = seed
+
+    def random(self, count=None, constraint=None):
+        # count vectors, endless if None, that satisfy constraint(vector)
+        rng = random.Random(self.seed)
+        num_vectors = 0
+        while count is None or num_vectors < count:
+            vector = rng.getrandbits(self.num_bits)
+            if constraint is None or constraint(vector):
+                num_vectors += 1
+                yield vector
+
+    def walking_ones(self):
+        # a single bit set, then a single bit cleared
+        ones = (1 << self.num_bits) - 1
+        for k in range(self.num_bits):
+            yield 1 << k
+        for k in range(self.num_bits):
+            yield ones ^ (1 << k)
+
+    def corner_cases(self):
+        # every combination of 0, 1, the highest bit alone, the maximum
+        # and the maximum minus 1 in each field
+        values = []
+        for num_bits in self.fields:
+            maximum = (1 << num_bits) - 1
+            highest = 1 << num_bits >> 1 # 0 for a field of 0 bits
+            values.append(sorted({value for value in (0, 1, highest, maximum, maximum - 1)
+                                  if 0 <= value <= maximum}))
+        for combination in itertools.product(*values):
+            vector = 0
+            shift = 0
+            for value, num_bits in zip(combination, self.fields):
+                vector |= value << shift
+                shift += num_bits
+            yield vector
+
+    def vectors(self, num_random=None, constraint=None):
+        return itertools.chain(self.corner_cases(), self.walking_ones(),
+                               self.random(num_random, constraint))
+
+
+class Bus:
+    # pins taken as the bits of an int, pins[0] the least significant
+    def __init__(self, name, pins):
+        self.name = name
+        self.pins = list(pins)
+
+    def __len__(self):
+        return len(self.pins)
+
+    def set_value(self, value):
+        for k, pin in enumerate(self.pins):
+            pin.set_state(value >> k & 1 == 1)
+
+    def value(self):
+        res = 0
+        for pin in reversed(self.pins):
+            res = res << 1 | bool(pin.is_state())
+        return res
+
+
+def ints_to_bits(values, num_bits):
+    # Many ints at once to a matrix of bools with a row per int and column k
+    # its bit k, like the inputs of Component.evaluate_batch(). NumPy arrays
+    # (of up to 64 bits) with NumPy, lists of rows without.
+    if np is not None:
+        values = np.asarray(values, dtype=np.uint64)
+        shifts = np.arange(num_bits, dtype=np.uint64)
+        return (values[:, None] >> shifts & np.uint64(1)).astype(bool)
+    return [[value >> k & 1 == 1 for k in range(num_bits)] for value in values]
+
+
+def bits_to_ints(bits):
+    # inverse of ints_to_bits
+    if np is not None and isinstance(bits, np.ndarray):
+        shifts = np.arange(bits.shape[1], dtype=np.uint64)
+        return (bits.astype(np.uint64) << shifts).sum(axis=1, dtype=np.uint64)
+    return [sum(bool(bit) << k for k, bit in enumerate(row)) for row in bits]
+
+
+def pack_vectors(vectors, num_bits):
+    # vectors are ints with bit k = state of input k. Returns num_bits words,
+    # bit j of word k is bit k of vectors[j]
+    mask = (1 << num_bits) - 1
+    rows = [format(vector & mask, '0{}b'.format(num_bits)) for vector in reversed(vectors)]
+    if not rows:
+        return [0] * num_bits
+    return [int(''.join(column), 2) for column in zip(*rows)][::-1]
+
+
+def unpack_words(words, count):
+    # inverse of pack_vectors
+    columns = [format(word, '0{}b'.format(count)) for word in reversed(words)]
+    if not columns:
+        return [0] * count
+    return [int(''.join(row), 2) for row in zip(*columns)][::-1]
+
+
+def exhaustive_words(num_bits, start, count):
+    # same as pack_vectors(range(start, start + count), num_bits), but built
+    # from periodic patterns when count is a power of two and start a
+    # multiple of it
+    if count & (count - 1) or start % count:
+        return pack_vectors(range(start, start + count), num_bits)
+    ones = (1 << count) - 1
+    words = []
+    for k in range(num_bits):
+        period = 2 ** (k + 1)
+        if period <= count:
+            half = period // 2
+            block = ((1 << half) - 1) << half
+            words.append(block * (ones // ((1 << period) - 1)))
+        else:
+            words.append(ones if start >> k & 1 else 0)
+    return words
+
+
+class NetlistBuilder:
+    # Receives a netlist from read_blif() or read_verilog(), nets by name and
+    # in any order, and builds a Component (this class) or a CompiledCircuit
+    # (CompiledBuilder). The pins of a gate are connected to the pin that
+    # drives their net as soon as it is known.
+    def __init__(self, name):
+        self.component = Component(name, 0, 0)
+        self.drivers = {} # net -> pin
+        self.waiting = {} # net -> pins waiting for its driver
+        # nets of the gates made by inverted() and constant(). Their names,
+        # like those of the nets made by add_cover(), have a space, so that
+        # they are not the names of nets of the netlist.
+        self.made = set()
+
+    def add_input(self, net):
+        pin = Pin(net, self.component, 'input', len(self.component.inputs))
+        self.component.inputs.append(pin)
+        self.drive(net, pin)
+
+    def add_output(self, net):
+        pin = Pin(net, self.component, 'output', len(self.component.outputs))
+        self.component.outputs.append(pin)
+        self.connect(net, pin)
+
+    def add_gate(self, cell, ins, out):
+        gate = cell(out, len(ins))
+        self.component.add_circuit(gate)
+        for net, pin in zip(ins, gate.inputs):
+            self.connect(net, pin)
+        self.drive(out, gate.outputs[0])
+
+    def drive(self, net, pin):
+        if net in self.drivers:
+            raise ValueError('net {} has two drivers'.format(net))
+        self.drivers[net] = pin
+        for waiting_pin in self.waiting.pop(net, ()):
+            Connection(pin, waiting_pin)
+
+    def connect(self, net, pin):
+        if net in self.drivers:
+            Connection(self.drivers[net], pin)
+        else:
+            self.waiting.setdefault(net, []).append(pin)
+
+    def inverted(self, net):
+        inverted_net = 'not ' + net
+        if inverted_net not in self.made:
+            self.made.add(inverted_net)
+            self.add_gate(Not, [net], inverted_net)
+        return inverted_net
+
+    def constant(self, state):
+        # an And of no inputs is always True, an Or of none always False
+        net = "1'b1" if state else "1'b0"
+        if net not in self.made:
+            self.made.add(net)
+            self.add_gate(And if state else Or, [], net)
+        return net
+
+    def finish(self):
+        if self.waiting:
+            raise ValueError('nets without driver: {}'.format(', '.join(self.waiting)))
+        return self.component
+
+
+class CompiledBuilder(NetlistBuilder):
+    # the same, but straight to the arrays of a CompiledCircuit, without
+    # making a circuit and pins per gate
+    def __init__(self, name):
+        self.name = name
+        self.net_ids = {} # net -> id
+        self.driven = set()
+        self.gates = []
+        self.input_nets = []
+        self.output_nets = []
+        self.made = set()
+
+    def net(self, net):
+        return self.net_ids.setdefault(net, len(self.net_ids))
+
+    def add_input(self, net):
+        self.input_nets.append(self.net(net))
+        self.drive(net)
+
+    def add_output(self, net):
+        self.output_nets.append(self.net(net))
+
+    def add_gate(self, cell, ins, out):
+        self.gates.append((cell, [self.net(net) for net in ins], self.net(out)))
+        self.drive(out)
+
+    def drive(self, net):
+        if net in self.driven:
+            raise ValueError('net {} has two drivers'.format(net))
+        self.driven.add(net)
+
+    def finish(self):
+        undriven = [net for net in self.net_ids if net not in self.driven]
+        if undriven:
+            raise ValueError('nets without driver: {}'.format(', '.join(undriven)))
+        # the ports keep their names, like in a compiled component
+        pin_nets = self.input_nets + self.output_nets
+        hierarchy = Hierarchy([self.name], array('i', [0, len(pin_nets)]),
+                              array('i', [len(self.input_nets)]), array('i', pin_nets))
+        return CompiledCircuit(self.name, len(self.net_ids), self.gates,
+                               self.input_nets, self.output_nets, hierarchy)
+
+
+def blif_statements(file_name):
+    # the lines of a BLIF file as lists of words, without comments and with
+    # the lines continued by \ joined
+    with open(file_name) as file:
+        words = []
+        for line in file:
+            line = line.split('#', 1)[0].rstrip()
+            continued = line.endswith('\\')
+            words += line.rstrip('\\').split()
+            if words and not continued:
+                yield words
+                words = []
+        if words:
+            yield words
+
+
+def read_blif(file_name, compiled=False):
+    # The first model of a BLIF file as a Component of And, Or and Not
+    # gates, or as a CompiledCircuit if compiled, reading it line by line.
+    # Each .names becomes an And per row of its cover and an Or of them.
+    builder_class = CompiledBuilder if compiled else NetlistBuilder
+    builder = None
+    cover = None # (inputs, output, rows) of the .names being read
+    for words in blif_statements(file_name):
+        if words[0].startswith('.') and cover is not None:
+            add_cover(builder, *cover)
+            cover = None
+        if builder is None:
+            name = words[1] if words[0] == '.model' else os.path.basename(file_name)
+            builder = builder_class(name)
+        if words[0] == '.inputs':
+            for net in words[1:]:
+                builder.add_input(net)
+        elif words[0] == '.outputs':
+            for net in words[1:]:
+                builder.add_output(net)
+        elif words[0] == '.names':
+            cover = (words[1:-1], words[-1], [])
+        elif words[0] == '.end':
+            break
+        elif words[0] == '.model':
+            pass
+        elif words[0].startswith('.'):
+            raise ValueError('{}: {} is not supported'.format(file_name, words[0]))
+        elif cover is None or len(words) != (2 if cover[0] else 1):
+            raise ValueError('{}: unexpected {}'.format(file_name, ' '.join(words)))
+        else:
+            cover[2].append(words)
+    if cover is not None:
+        add_cover(builder, *cover)
+    return builder.finish()
+
+
+def add_cover(builder, ins, out, rows):
+    # the rows give the input values, 1, 0 or - (any), for which out is 1,
+    # or 0 if that is their last column
+    if not rows:
+        builder.add_gate(Or, [], out) # always 0
+        return
+    if len({row[-1] for row in rows}) > 1:
+        raise ValueError('the cover of {} has rows for 1 and for 0'.format(out))
+    inverted = rows[0][-1] == '0'
+    if len(rows) == 1 and len(ins) == 1 and rows[0][0] in ('0', '1'):
+        # a buffer or an inverter
+        builder.add_gate(And if (rows[0][0] == '1') != inverted else Not, ins, out)
+        return
+    cubes = []
+    for row in rows:
+        literals = row[0] if ins else ''
+        cubes.append([net if literal == '1' else builder.inverted(net)
+                      for net, literal in zip(ins, literals) if literal != '-'])
+    sum_net = out
+    if inverted:
+        # the sum is the inverse of out, unless inverted(out) has been made
+        sum_net = 'not ' + out
+        if sum_net in builder.made:
+            sum_net = 'sum ' + out
+        builder.made.add(sum_net)
+    if len(cubes) == 1:
+        builder.add_gate(And, cubes[0], sum_net)
+    else:
+        terms = []
+        for k, literals in enumerate(cubes):
+            if len(literals) == 1:
+                terms.append(literals[0])
+            else:
+                terms.append('{} term{}'.format(out, k))
+                builder.add_gate(And, literals, terms[-1])
+        builder.add_gate(Or, terms, sum_net)
+    if inverted:
+        builder.add_gate(Not, [sum_net], out)
+
+
+verilog_token = re.compile(r"\\\S+|[A-Za-z_][\w$]*|\d*'[bBoOdDhH][\w]+|\d+|\S")
+verilog_identifier = re.compile(r'[A-Za-z_][\w$]*\Z')
+
+
+def verilog_statements(file_name):
+    # the statements of a Verilog file as lists of tokens, without comments
+    with open(file_name) as file:
+        tokens = []
+        in_comment = False
+        for line in file:
+            if in_comment:
+                if '*/' not in line:
+                    continue
+                line = line.split('*/', 1)[1]
+                in_comment = False
+            line = re.sub(r'/\*.*?\*/', ' ', line.split('//', 1)[0])
+            if '/*' in line:
+                line = line.split('/*', 1)[0]
+                in_comment = True
+            for token in verilog_token.findall(line):
+                if token == ';':
+                    yield tokens
+                    tokens = []
+                elif token == 'endmodule' and not tokens:
+                    yield [token]
+                else:
+                    tokens.append(token)
+
+
+verilog_gates = {'and': And, 'or': Or, 'not': Not, 'buf': And, 'nand': Nand,
+                 'nor': Nor, 'xor': Xor, 'xnor': Xnor}
+
+
+def read_verilog(file_name, compiled=False):
+    # The first module of a gate-level Verilog file, like read_blif(). The
+    # bits of a vector are the nets a[0], a[1]... and the inputs and
+    # outputs of the component are in the order they are declared.
+    builder_class = CompiledBuilder if compiled else NetlistBuilder
+    builder = None
+    for tokens in verilog_statements(file_name):
+        if not tokens:
+            continue
+        keyword = tokens[0]
+        if keyword == 'module':
+            builder = builder_class(verilog_name(tokens[1]))
+            # ANSI style ports, declared in the header
+            declaration = []
+            for token in tokens[3:-1]:
+                if token in ('input', 'output') and declaration:
+                    add_verilog_ports(builder, declaration)
+                    declaration = []
+                if token in ('input', 'output') or declaration:
+                    declaration.append(token)
+            if declaration:
+                add_verilog_ports(builder, declaration)
+        elif builder is None:
+            raise ValueError('{}: {} before module'.format(file_name, keyword))
+        elif keyword == 'endmodule':
+            break
+        elif keyword in ('input', 'output'):
+            add_verilog_ports(builder, tokens)
+        elif keyword == 'wire':
+            pass
+        elif keyword == 'assign':
+            equal = tokens.index('=')
+            add_verilog_assign(builder, verilog_net(builder, tokens[1:equal]),
+                               tokens[equal + 1:])
+        elif keyword in verilog_gates:
+            start = tokens.index('(')
+            nets = [verilog_net(builder, port)
+                    for port in split_verilog_list(tokens[start + 1:-1])]
+            builder.add_gate(verilog_gates[keyword], nets[1:], nets[0])
+        else:
+            raise ValueError('{}: {} is not supported'.format(file_name, keyword))
+    if builder is None:
+        raise ValueError('{}: no module'.format(file_name))
+    return builder.finish()
+
+
+def verilog_name(token):
+    # escaped identifiers, like \a[3] , are the name after the \
+    return token[1:] if token.startswith('\\') else token
+
+
+def split_verilog_list(tokens):
+    items = [[]]
+    for token in tokens:
+        if token == ',':
+            items.append([])
+        else:
+            items[-1].append(token)
+    return items
+
+
+def add_verilog_assign(builder, out, tokens):
+    # out = a net, a constant or condition ? net : net, nested, as 2:1 muxes
+    tokens = deque(tokens)
+    names = ('{}.{}'.format(out, k) for k in itertools.count())
+
+    def operand():
+        if tokens[0] == '(':
+            tokens.popleft()
+            net = expression(next(names))
+            if tokens.popleft() != ')':
+                raise ValueError('missing ) in the assign of {}'.format(out))
+            return net
+        net_tokens = [tokens.popleft()]
+        if tokens and tokens[0] == '[':
+            net_tokens += [tokens.popleft() for _ in range(3)]
+        return verilog_net(builder, net_tokens)
+
+    def expression(net):
+        condition = operand()
+        if not tokens or tokens[0] != '?':
+            return condition
+        tokens.popleft()
+        when_true = expression(next(names))
+        if tokens.popleft() != ':':
+            raise ValueError('missing : in the assign of {}'.format(out))
+        when_false = expression(next(names))
+        builder.add_gate(Mux, [when_false, when_true, condition], net)
+        return net
+    net = expression(out)
+    if tokens:
+        raise ValueError('{} is not supported'.format(' '.join(tokens)))
+    if net != out:
+        builder.add_gate(And, [net], out)
+
+
+def add_verilog_ports(builder, tokens):
+    # input [7:0] a, b or output y, z
+    add = builder.add_input if tokens[0] == 'input' else builder.add_output
+    tokens = [token for token in tokens[1:] if token not in ('wire', 'reg')]
+    bits = [None]
+    if tokens and tokens[0] == '[':
+        colon = tokens.index(':')
+        first, last = int(tokens[1]), int(tokens[colon + 1])
+        bits = range(min(first, last), max(first, last) + 1)
+        tokens = tokens[tokens.index(']') + 1:]
+    for port in split_verilog_list(tokens):
+        if not port: # the comma before the next declaration, in a module header
+            continue
+        for bit in bits:
+            name = verilog_name(port[0])
+            add(name if bit is None else '{}[{}]'.format(name, bit))
+
+
+def verilog_net(builder, tokens):
+    # a net, a bit of a vector or a constant 1'b0 or 1'b1
+    if "'" in tokens[0]:
+        return builder.constant(int(tokens[0].split("'")[1][1:], 2) == 1)
+    if len(tokens) == 4 and tokens[1] == '[':
+        return '{}[{}]'.format(verilog_name(tokens[0]), tokens[2])
+    if len(tokens) != 1:
+        raise ValueError('{} is not supported'.format(' '.join(tokens)))
+    return verilog_name(tokens[0])
+
+
+def netlist_names(circuit, valid):
+    # The compiled circuit of circuit, a Component or a CompiledCircuit, and
+    # the names of its nets for a netlist file: the names of the ports, if
+    # valid(), n<id> for the others. Returns also the (output, net) that need
+    # a buffer, because the net of the output has already another name.
+    compiled = circuit.compile() if isinstance(circuit, Component) else circuit
+    used = set()
+
+    def port_names(pins, prefix, count):
+        names = []
+        for k in range(count):
+            name = pins[k].name if pins else None
+            if name is None or not valid(name) or name in used:
+                name = '{}{}'.format(prefix, k)
+                while name in used:
+                    name = '_' + name
+            used.add(name)
+            names.append(name)
+        return names
+    is_component = isinstance(circuit, Component)
+    input_names = port_names(circuit.inputs if is_component else None, 'in',
+                             len(compiled.input_nets))
+    output_names = port_names(circuit.outputs if is_component else None, 'out',
+                              len(compiled.output_nets))
+    names = dict(zip(compiled.input_nets, input_names))
+    buffers = []
+    driven = set(compiled.gate_outputs)
+    for name, net in zip(output_names, compiled.output_nets):
+        if net in names or net not in driven:
+            buffers.append((name, net))
+        else:
+            names[net] = name
+    for net in range(compiled.num_nets):
+        if net not in names:
+            name = 'n{}'.format(net)
+            while name in used:
+                name = '_' + name
+            names[net] = name
+    return compiled, input_names, output_names, names, buffers
+
+
+# rows of the BLIF cover of a gate of n inputs
+blif_covers = {
+    And: lambda n: ['1' * n + ' 1'],
+    Or: lambda n: ['-' * k + '1' + '-' * (n - k - 1) + ' 1' for k in range(n)],
+    Not: lambda n: ['0 1'],
+    Nand: lambda n: ['-' * k + '0' + '-' * (n - k - 1) + ' 1' for k in range(n)],
+    Nor: lambda n: ['0' * n + ' 1'],
+    Xor: lambda n: [row + ' 1' for row in parity_rows(n, 1)],
+    Xnor: lambda n: [row + ' 1' for row in parity_rows(n, 0)],
+    Mux: lambda n: [row + ' 1' for row in mux_rows(n)],
+}
+
+
+def mux_rows(n):
+    # a row for each data input, with its select values
+    num_select = n.bit_length() - 1
+    num_data = 2 ** num_select
+    return ['-' * i + '1' + '-' * (num_data - i - 1) +
+            format(i, '0{}b'.format(num_select))[::-1] for i in range(num_data)]
+
+
+def parity_rows(n, parity):
+    # the 2**(n-1) input values of n bits with an even (0) or odd number of 1s
+    return [format(v, '0{}b'.format(n)) if n else ''
+            for v in range(2**n) if bin(v).count('1') % 2 == parity]
+
+
+def write_blif(circuit, file_name):
+    # circuit, a Component or a CompiledCircuit, flattened to a BLIF model.
+    # The cover of a Xor or Xnor of n inputs has 2**(n-1) rows, so those of
+    # more than 2 inputs are written as a tree of Xors of 2 inputs.
+    compiled, input_names, output_names, names, buffers = netlist_names(
+        circuit, lambda name: not re.search(r'\s|#', name))
+    used = set(names.values()) | set(output_names)
+
+    def new_name(name):
+        while name in used:
+            name = '_' + name
+        used.add(name)
+        return name
+    with open(file_name, 'w') as file:
+        def write_cover(cell, ins, out):
+            file.write('.names {}\n'.format(' '.join(ins + [out])))
+            for row in blif_covers[cell](len(ins)):
+                file.write(row.strip() + '\n')
+        file.write('.model {}\n'.format(compiled.name))
+        file.write('.inputs {}\n'.format(' '.join(input_names)))
+        file.write('.outputs {}\n'.format(' '.join(output_names)))
+        for g in range(compiled.num_gates):
+            cell, ins, out = compiled.gate(g)
+            ins = [names[net] for net in ins]
+            if cell in (Xor, Xnor):
+                suffixes = itertools.count()
+                while len(ins) > 2:
+                    pairs = []
+                    for k in range(0, len(ins) - 1, 2):
+                        pairs.append(new_name('{}.x{}'.format(names[out], next(suffixes))))
+                        write_cover(Xor, ins[k:k + 2], pairs[-1])
+                    ins = pairs + ins[len(ins) // 2 * 2:]
+            write_cover(cell, ins, names[out])
+        for name, net in buffers:
+            file.write('.names {} {}\n1 1\n'.format(names[net], name))
+        file.write('.end\n')
+
+
+verilog_primitives = {And: 'and', Or: 'or', Not: 'not', Nand: 'nand', Nor: 'nor',
+                      Xor: 'xor', Xnor: 'xnor'}
+
+
+def verilog_mux(ins):
+    # select ? d1 : d0, nested for more select inputs
+    num_select = len(ins).bit_length() - 1
+    data, select = ins[:2**num_select], ins[2**num_select:]
+
+    def tree(data, j):
+        if len(data) == 1:
+            return data[0]
+        half = len(data) // 2
+        return '{} ? {} : {}'.format(select[j], *[
+            branch[0] if len(branch) == 1 else '(' + tree(branch, j - 1) + ')'
+            for branch in (data[half:], data[:half])])
+    return tree(data, num_select - 1)
+
+
+# cells written as an assign of an expression of the names of their inputs
+verilog_expressions = {Mux: verilog_mux}
+
+
+def write_verilog(circuit, file_name):
+    # circuit, a Component or a CompiledCircuit, flattened to a gate-level
+    # Verilog module. Names that are not identifiers are escaped.
+    compiled, input_names, output_names, names, buffers = netlist_names(
+        circuit, lambda name: not re.search(r'\s', name))
+
+    def escaped(name):
+        return name if verilog_identifier.match(name) else '\\' + name + ' '
+    names = {net: escaped(name) for net, name in names.items()}
+    with open(file_name, 'w') as file:
+        file.write('module {}({});\n'.format(escaped(compiled.name), ', '.join(
+            escaped(name) for name in input_names + output_names)))
+        for name in input_names:
+            file.write('  input {};\n'.format(escaped(name)))
+        for name in output_names:
+            file.write('  output {};\n'.format(escaped(name)))
+        ports = set(compiled.input_nets) | set(compiled.output_nets)
+        for g in range(compiled.num_gates):
+            cell, ins, out = compiled.gate(g)
+            if out not in ports:
+                file.write('  wire {};\n'.format(names[out]))
+            if not ins:
+                file.write("  assign {} = 1'b{:d};\n".format(names[out], cell.function([])))
+            elif cell in verilog_expressions:
+                file.write('  assign {} = {};\n'.format(names[out], verilog_expressions[cell](
+                    [names[net] for net in ins])))
+            else:
+                file.write('  {} g{}({});\n'.format(verilog_primitives[cell], g, ', '.join(
+                    names[net] for net in [out] + list(ins))))
+        for name, net in buffers:
+            file.write('  assign {} = {};\n'.format(escaped(name), names[net]))
+        file.write('endmodule\n')
+
+
+def optimize(circuit, constants=None, compiled=False):
+    # A smaller netlist equivalent to circuit, a Component or a
+    # CompiledCircuit, as a Component of gates, or a CompiledCircuit if
+    # compiled. Constants are propagated, from gates of no inputs, nets
+    # without driver and the inputs tied by constants, {number of input:
+    # state}; a gate equal to another one, same cell and inputs, or that
+    # passes an input through, is replaced by it; and gates that no output
+    # depends on are removed.
+    flat, input_names, output_names, names, buffers = netlist_names(
+        circuit, lambda name: not re.search(r'\s', name))
+    if flat.registers:
+        raise ValueError('optimize() does not keep flip-flops')
+    # nets -1 and -2 are the constants 0 and 1
+    value = {-1: 0, -2: 1} # net -> state, of the constant nets
+    driven = set(flat.input_nets) | set(flat.gate_outputs)
+    for net in range(flat.num_nets):
+        if net not in driven:
+            value[net] = flat.nets[net]
+    for num_input, state in (constants or {}).items():
+        value[flat.input_nets[num_input]] = int(bool(state))
+    alias = {} # net -> net with the same state
+    inverse = {} # output net of a Not -> its input net
+    table = {} # (cell, inputs) -> output net, of the gates kept
+    gates = []
+    for g in range(flat.num_gates): # in level order
+        cell, ins, out = flat.gate(g)
+        result = simplify_gate(cell, [alias.get(net, net) for net in ins], value, inverse)
+        if isinstance(result, int):
+            alias[out] = result
+        elif result in table:
+            alias[out] = table[result]
+        else:
+            table[result] = out
+            gates.append((result[0], result[1], out))
+            if result[0] is Not:
+                inverse[out] = result[1][0]
+    outputs = [alias.get(net, net) for net in flat.output_nets]
+    live = set(outputs)
+    kept = []
+    for cell, ins, out in reversed(gates):
+        if out in live:
+            kept.append((cell, ins, out))
+            live.update(ins)
+    builder = (CompiledBuilder if compiled else NetlistBuilder)(flat.name)
+
+    def name(net):
+        return builder.constant(value[net]) if net in value else names[net]
+    for input_name in input_names:
+        builder.add_input(input_name)
+    for cell, ins, out in reversed(kept):
+        builder.add_gate(cell, [name(net) for net in ins], names[out])
+    for output_name, net in zip(output_names, outputs):
+        if net in value:
+            builder.add_gate(And if value[net] else Or, [], output_name)
+        elif names[net] != output_name:
+            builder.add_gate(And, [names[net]], output_name)
+        builder.add_output(output_name)
+    return builder.finish()
+
+
+def simplify_gate(cell, ins, value, inverse):
+    # Returns the net that has the same state as gate cell of input nets
+    # ins, if any, else the (cell, input nets) of the simplest equal gate,
+    # with the inputs sorted if their order does not matter
+    if all(net in value for net in ins):
+        return -2 if cell.bit_function([value[net] for net in ins]) else -1
+    if cell in (And, Nand, Or, Nor):
+        decisive = 0 if cell in (And, Nand) else 1 # the state that decides the output
+        inverted = cell in (Nand, Nor)
+        if any(value.get(net) == decisive for net in ins):
+            return -1 - (decisive ^ inverted)
+        ins = sorted({net for net in ins if net not in value})
+        if any(inverse.get(net) in ins for net in ins): # x and not x
+            return -1 - (decisive ^ inverted)
+        if len(ins) == 1:
+            return (Not, (ins[0],)) if inverted else ins[0]
+        return (cell, tuple(ins))
+    if cell in (Xor, Xnor):
+        inverted = cell is Xnor
+        odd = set() # nets that are an odd number of times in ins
+        for net in ins:
+            if net in value:
+                inverted ^= value[net]
+            else:
+                odd ^= {net}
+        if not odd:
+            return -1 - inverted
+        if len(odd) == 1:
+            net, = odd
+            return (Not, (net,)) if inverted else net
+        return (Xnor if inverted else Xor, tuple(sorted(odd)))
+    if cell is Not:
+        if ins[0] in inverse:
+            return inverse[ins[0]]
+        return (Not, tuple(ins))
+    if cell is Mux:
+        num_data = 2 ** (len(ins).bit_length() - 1)
+        data, select = ins[:num_data], ins[num_data:]
+        if all(net in value for net in select):
+            return data[sum(value[net] << j for j, net in enumerate(select))]
+        if len(set(data)) == 1:
+            return data[0]
+    return (cell, tuple(ins))
+
+
+# the circuits of template_solucio.py, made by functions, for tests and benchmarks
+def build_xor():
+    xor = Component('xor', 2, 1)
+    or1, and1, not1, and2 = Or('or1'), And('and1'), Not('not1'), And('and2')
+    for circuit in [or1, and1, not1, and2]:
+        xor.add_circuit(circuit)
+    Connection(xor.inputs[0], and1.inputs[0])
+    Connection(xor.inputs[0], or1.inputs[0])
+    Connection(xor.inputs[1], and1.inputs[1])
+    Connection(xor.inputs[1], or1.inputs[1])
+    Connection(or1.outputs[0], and2.inputs[0])
+    Connection(and1.outputs[0], not1.inputs[0])
+    Connection(not1.outputs[0], and2.inputs[1])
+    Connection(and2.outputs[0], xor.outputs[0])
+    return xor
+
+
+def build_one_bit_adder():
+    adder = Component('OneBitAdder', 3, 2)
+    xor1, xor2 = build_xor(), build_xor()
+    xor1.rename('xor1')
+    xor2.rename('xor2')
+    and1, and2, or1 = And('and1'), And('and2'), Or('or1')
+    for circuit in [xor1, xor2, and1, and2, or1]:
+        adder.add_circuit(circuit)
+    Connection(adder.inputs[0], xor1.inputs[0])
+    Connection(adder.inputs[1], xor1.inputs[1])
+    Connection(xor1.outputs[0], xor2.inputs[0])
+    Connection(adder.inputs[2], xor2.inputs[1])
+    Connection(xor1.outputs[0], and1.inputs[0])
+    Connection(adder.inputs[2], and1.inputs[1])
+    Connection(adder.inputs[0], and2.inputs[0])
+    Connection(adder.inputs[1], and2.inputs[1])
+    Connection(and1.outputs[0], or1.inputs[0])
+    Connection(and2.outputs[0], or1.inputs[1])
+    Connection(xor2.outputs[0], adder.outputs[0])
+    Connection(or1.outputs[0], adder.outputs[1])
+    return adder
+
+
+def build_native_one_bit_adder():
+    # 3 gates instead of 11: the carry out is the carry in if A xor B, else A
+    adder = Component('NativeOneBitAdder', 3, 2)
+    xor_ab, xor_s, mux_co = Xor('xorAB'), Xor('xorS'), Mux('muxCo')
+    for circuit in [xor_ab, xor_s, mux_co]:
+        adder.add_circuit(circuit)
+    Connection(adder.inputs[0], xor_ab.inputs[0])
+    Connection(adder.inputs[1], xor_ab.inputs[1])
+    Connection(xor_ab.outputs[0], xor_s.inputs[0])
+    Connection(adder.inputs[2], xor_s.inputs[1])
+    Connection(adder.inputs[0], mux_co.inputs[0])
+    Connection(adder.inputs[2], mux_co.inputs[1])
+    Connection(xor_ab.outputs[0], mux_co.inputs[2])
+    Connection(xor_s.outputs[0], adder.outputs[0])
+    Connection(mux_co.outputs[0], adder.outputs[1])
+    return adder
+
+
+def build_n_bits_adder(n, build_cell=build_one_bit_adder):
+    # inputs A = 0..n-1, B = n..2n-1 and carry in 2n, outputs S = 0..n-1 and carry out n
+    adder = Component('{}BitsAdder'.format(n), 2*n + 1, n + 1)
+    one_bit_adder = build_cell()
+    carry = adder.inputs[2*n]
+    for i in range(n):
+        cell = deepcopy(one_bit_adder)
+        cell.rename('oneBitAdder{}'.format(i + 1))
+        adder.add_circuit(cell)
+        Connection(adder.inputs[i], cell.inputs[0])
+        Connection(adder.inputs[n + i], cell.inputs[1])
+        Connection(carry, cell.inputs[2])
+        Connection(cell.outputs[0], adder.outputs[i])
+        carry = cell.outputs[1]
+    Connection(carry, adder.outputs[n])
+    return adder
@@ -1,159 +1,14 @@
-from abc import ABC
 from copy import deepcopy
 
-# class Id():
-#     id = 0
-#     @staticmethod
-#     def get():
-#         Id.id += 1
-#         return str(Id.id)
-
-class Circuit(ABC):
-    def __init__(self, name, num_inputs, num_outputs):
-        self.name = name
-        self.inputs = [Pin('input {} of {}'.format(i,name)) for i in range(num_inputs)]
-        self.outputs = [Pin('output {} of {}'.format(i,name)) for i in range(num_outputs)]
-        self.connections = []
-
-    def rename(self, new_name):
-        self.name = new_name
-        for i,pin in enumerate(self.inputs):
-            pin.name = 'input {} of {}'.format(i,new_name)
-        for i,pin in enumerate(self.outputs):
-            pin.name = 'output {} of {}'.format(i,new_name)
-
-    def process(self):
-        raise NotImplementedError
-        # can not call process(), it's an abstract method
-
-    def set_input(self, num_input, state):
-        self.inputs[num_input].set_state(state)
-
-    # def find_pin(self, name):
-    #     pins = self.inputs + self.outputs
-    #     names = [pin.name for pin in pins]
-    #     if name in names:
-    #         idx = names.index(name)
-    #         return pins[idx]
-    #     return None
-
-
-
-class And(Circuit):
-    def __init__(self, name, num_inputs=2):
-        super().__init__(name, num_inputs, 1)
-
-    def process(self):
-        result = True
-        for pin_input in self.inputs:
-            result = result and pin_input.is_state()
-        self.outputs[0].set_state(result)
-
-
-class Or(Circuit):
-    def __init__(self, name, num_inputs=2):
-        super().__init__(name, num_inputs, 1)
-
-    def process(self):
-        result = False
-        for pin_input in self.inputs:
-            result = result or pin_input.is_state()
-        self.outputs[0].set_state(result)
-
-
-class Not(Circuit):
-    def __init__(self, name):
-        super().__init__(name, 1, 1)
-
-    def process(self):
-        self.outputs[0].set_state(not self.inputs[0].is_state())
-
-
-class Component(Circuit):
-    def __init__(self, name, num_inputs, num_outputs):
-        super().__init__(name, num_inputs, num_outputs)
-        self.circuits = []
-
-    def add_circuit(self, circuit):
-        self.circuits.append(circuit)
-
-    def process(self):
-        for circuit in self.circuits:
-            circuit.process()
-
-    # # override
-    # def find_pin(self, name):
-    #     pin = super().find_pin(name)
-    #     if pin is None:
-    #         for circ in self.circuits:
-    #             pin = circ.find_pin(name)
-    #             if pin is not None:
-    #                 break
-    #     return pin
-
-
-class Observable(ABC):
-    def __init__(self):
-        self.observers = []
-
-    def add_observer(self, observer):
-        self.observers.append(observer)
-
-    def remove_observer(self, observer):
-        assert observer in self.observers
-        self.observers.remove(observer)
-        print('{} does not observe anymore {}'\
-              .format(observer.name, self.name))
-
-    def notify_observers(self, an_object=None):
-        for obs in self.observers:
-            obs.update(self, an_object)
-            # observable sends itself to each observer
-
-
-class Observer(ABC):
-    def update(self, observable, an_object):
-        raise NotImplementedError
-        # abstract method
-
-
-class Pin(Observable, Observer):
-    def __init__(self, name):
-        super().__init__()
-        self.name = name
-        self.state = None
-
-    def is_state(self):
-        return self.state
-
-    def set_state(self, new_state):
-        self.state = new_state
-        self.notify_observers(self)
-
-    def update(self, observed_pin, an_object):
-        self.set_state(observed_pin.is_state())
-
-    def __str__(self):
-        str = self.name
-        if len(self.observers) > 0:
-            str += ' observed by'
-            for obs in self.observers:
-                str += ' ' + obs.name + ' '
-        return str
-
-
-class Connection:
-    def __init__(self, pin_from, pin_to):
-        pin_from.add_observer(pin_to)
-        print('{} is observer of {}'.format(pin_to.name, pin_from.name))
-
+from circuits import And, Component, Connection, Not, Or
 
 xor1 = Component('xor1', 2, 1)
 or1 = Or('or1')
 and1 = And('and1')
 not1 = Not('not1')
 and2 = And('and2')
-# the order of adds will matter to simulation
+# process() sorts the circuits by their connections, so the order of adds
+# does not matter to simulation
 xor1.add_circuit(or1) # more readable than xor.circuits.append(or)
 xor1.add_circuit(and1)
 xor1.add_circuit(not1)
@@ -176,7 +31,7 @@ xor2.rename('xor2')
 and3 = And('and3')
 and4 = And('and4') # or copy.deepcopy(and3) and rename
 or2 = Or('or2');
-# this order matters for the simulation
+# any order of adds is fine for the simulation
 one_bit_adder.add_circuit(xor1)
 one_bit_adder.add_circuit(xor2)
 one_bit_adder.add_circuit(and3)
@@ -300,17 +155,15 @@ for i in range(n):
 def decimal_to_boolean_list(num, num_bits):
     assert num >= 0
     # most significative bit is the leftmost
-    v = [bit=='1' for bit in bin(num).replace('0b','')]
-    # bin() explained here https://docs.python.org/3/library/functions.html#bin
-    return [False]*(num_bits - len(v)) + v
+    num_bits = max(num_bits, num.bit_length())
+    return [num >> (num_bits - i - 1) & 1 == 1 for i in range(num_bits)]
 
 def boolean_list_to_decimal(bool):
     # most significative bit is the leftmost
     res = 0
-    num_bits = len(bool)
-    for i in range(num_bits):
-        res += bool[i] * 2 ** (num_bits - i - 1)
-        # True*5 == 5, False*5 == 0
+    for bit in bool:
+        res = res << 1 | bit
+        # True | 4 == 5, False | 4 == 4
     return res
 
 
@@ -341,4 +194,3 @@ pin_from.remove_observer(pin_to)
 pin_to.set_state(False)
 
 # now test addition of two numbers again and see that 1 + 15 + 0 = 0 etc.
-
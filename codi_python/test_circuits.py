@@ -0,0 +1,597 @@
+from copy import deepcopy
+import json
+import logging
+import os
+import random
+import sys
+
+import pytest
+
+from benchmark import compare_benchmarks, run_benchmarks
+import circuits
+from circuits import (And, Clock, CompiledCircuit, Component, Connection, CycleSimulator,
+                      DFlipFlop, Instance, Mux, Nand, NetlistBuilder, Nor, Not, Or,
+                      OscillationError, Pin, Profiler, Stimulus, Xnor, Xor, bits_to_ints,
+                      build_n_bits_adder, build_native_one_bit_adder, build_one_bit_adder,
+                      build_xor, exhaustive_words, ints_to_bits, log_connections, logger,
+                      optimize, read_blif, read_verilog, unpack_words, verify, write_blif,
+                      write_verilog)
+
+N = 4 # bits of the adders tested
+# vector v of the n-bits adder has A = bits 0..n-1, B = bits n..2n-1 and
+# carry in = bit 2n, its outputs S + 2**n carry out
+ONE_BIT_ADDER_TABLE = [((a, b, c), [(a + b + c) % 2 == 1, a + b + c >= 2])
+                       for a in [False, True] for b in [False, True] for c in [False, True]]
+
+
+def n_bits_adder_reference(v):
+    return v % 2**N + (v >> N) % 2**N + (v >> 2*N)
+
+
+def set_inputs(circuit, states):
+    for pin, state in zip(circuit.inputs, states):
+        pin.set_state(state)
+
+
+def output_states(circuit):
+    return [pin.is_state() for pin in circuit.outputs]
+
+
+def test_one_bit_adder():
+    adder = build_one_bit_adder()
+    for states, expected in ONE_BIT_ADDER_TABLE:
+        set_inputs(adder, states)
+        adder.process()
+        assert output_states(adder) == expected
+        assert adder.compile().evaluate(states) == expected
+
+
+@pytest.fixture(params=['lists', 'numpy'])
+def batch_type(request, monkeypatch):
+    # the functions of many vectors at once work on lists of rows without
+    # NumPy, and on NumPy arrays with it
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(circuits, 'np', None)
+    return list if request.param == 'lists' else circuits.np.ndarray
+
+
+@pytest.mark.parametrize('build', [build_one_bit_adder, build_native_one_bit_adder])
+def test_truth_table(batch_type, build):
+    table_inputs, table_outputs = build().truth_table()
+    assert isinstance(table_inputs, batch_type) and isinstance(table_outputs, batch_type)
+    assert [list(row) for row in table_inputs] == [list(states) for states, _ in ONE_BIT_ADDER_TABLE]
+    assert [list(row) for row in table_outputs] == [expected for _, expected in ONE_BIT_ADDER_TABLE]
+
+
+def test_hierarchical_names():
+    adder = build_one_bit_adder()
+    xor2 = adder.children['xor2']
+    assert xor2.find_pin('and1/input 1') is xor2.circuits[1].inputs[1]
+    assert adder.find_pin('xor2/and1/input 1') is xor2.circuits[1].inputs[1]
+    assert xor2.circuits[1].inputs[1].path() == 'OneBitAdder/xor2/and1/input 1'
+    assert len(adder.find_pins('xor?/and*/input 0')) == 4
+    # levels below the gates match nothing
+    assert len(adder.find_pins('*/*/input 0')) == 8
+    assert adder.find_pins('and1/x/input 0') == []
+    assert len(adder.find_pins_with_prefix('xor2/')) == len(xor2.pins())
+    # a change inside xor2 makes the compiled adder out of date
+    compiled = adder.compile()
+    and1 = xor2.children['and1']
+    observer = next(iter(and1.outputs[0].observers))
+    and1.outputs[0].remove_observer(observer)
+    assert adder.compile() is not compiled
+
+
+class Adder(Component):
+    # a subclass without __slots__, with attributes of its own
+    def __init__(self, width):
+        super().__init__('{}BitsAdder'.format(width), 2*width + 1, width + 1)
+        self.width = width
+
+
+def test_deepcopy_subclass():
+    adder = Adder(N)
+    copy = deepcopy(adder)
+    assert copy.width == N and copy.inputs[0] is not adder.inputs[0]
+
+
+def test_order_of_adds():
+    # gates added before the gates that drive them
+    not_not = Component('not_not', 1, 1)
+    not1, not2 = Not('not1'), Not('not2')
+    not_not.add_circuit(not2)
+    not_not.add_circuit(not1)
+    Connection(not_not.inputs[0], not1.inputs[0])
+    Connection(not1.outputs[0], not2.inputs[0])
+    Connection(not2.outputs[0], not_not.outputs[0])
+    for state in [False, True]:
+        not_not.set_input(0, state)
+        not_not.process()
+        assert not_not.outputs[0].is_state() == state
+
+
+def test_latch_settles():
+    # a set-reset latch made of two nor gates, each one an or and a not
+    latch = Component('latch', 2, 2) # set, reset -> q, not q
+    or1, not1, or2, not2 = Or('or1'), Not('not1'), Or('or2'), Not('not2')
+    for circuit in [or1, not1, or2, not2]:
+        latch.add_circuit(circuit)
+    Connection(latch.inputs[0], or1.inputs[0])
+    Connection(not2.outputs[0], or1.inputs[1])
+    Connection(or1.outputs[0], not1.inputs[0])
+    Connection(latch.inputs[1], or2.inputs[0])
+    Connection(not1.outputs[0], or2.inputs[1])
+    Connection(or2.outputs[0], not2.inputs[0])
+    Connection(not2.outputs[0], latch.outputs[0])
+    Connection(not1.outputs[0], latch.outputs[1])
+    for set_, reset, q in [(True, False, True), (False, False, True),
+                           (False, True, False), (False, False, False)]:
+        set_inputs(latch, [set_, reset])
+        latch.process()
+        assert output_states(latch) == [q, not q]
+
+
+def test_ring_oscillates():
+    ring = Component('ring', 0, 0)
+    nots = [Not('not{}'.format(i)) for i in range(3)]
+    for i, circuit in enumerate(nots):
+        ring.add_circuit(circuit)
+        Connection(circuit.outputs[0], nots[(i + 1) % 3].inputs[0])
+    with pytest.raises(OscillationError):
+        ring.process()
+
+
+def test_one_gate_ring_oscillates():
+    ring = Component('ring', 0, 0)
+    not1 = Not('not1')
+    ring.add_circuit(not1)
+    Connection(not1.outputs[0], not1.inputs[0])
+    with pytest.raises(OscillationError):
+        ring.process()
+
+
+def test_toggle_flip_flop():
+    toggle = Component('toggle', 0, 1)
+    clock = Clock('clock')
+    flip_flop = DFlipFlop('flip_flop')
+    not1 = Not('not1')
+    for circuit in [clock, flip_flop, not1]:
+        toggle.add_circuit(circuit)
+    Connection(clock.outputs[0], flip_flop.inputs[1])
+    Connection(flip_flop.outputs[0], not1.inputs[0])
+    Connection(not1.outputs[0], flip_flop.inputs[0])
+    Connection(flip_flop.outputs[0], toggle.outputs[0])
+    for cycle in range(4):
+        toggle.process()
+        assert toggle.outputs[0].is_state() == (cycle % 2 == 1)
+        clock.tick()
+        toggle.process()
+        clock.tick()
+    assert CycleSimulator(toggle, [toggle.outputs[0]]).run(6) == bytes([0, 1, 0, 1, 0, 1])
+
+
+def toggle_with_clock_input():
+    # the toggle flip-flop, with the clock as input 0
+    toggle = Component('toggle', 1, 1)
+    flip_flop, not1 = DFlipFlop('flip_flop'), Not('not1')
+    toggle.add_circuit(flip_flop)
+    toggle.add_circuit(not1)
+    Connection(toggle.inputs[0], flip_flop.inputs[1])
+    Connection(flip_flop.outputs[0], not1.inputs[0])
+    Connection(not1.outputs[0], flip_flop.inputs[0])
+    Connection(flip_flop.outputs[0], toggle.outputs[0])
+    return toggle
+
+
+def test_clock_nets():
+    toggle = toggle_with_clock_input()
+    with pytest.raises(ValueError, match='input'):
+        CycleSimulator(toggle, [toggle.outputs[0]])
+    # clocked by a Clock through an instance, or by an inverted clock
+    counter = Component('counter', 0, 1)
+    clock, not1 = Clock('clock'), Not('not1')
+    instance = Instance('toggle', toggle)
+    for circuit in [clock, not1, instance]:
+        counter.add_circuit(circuit)
+    Connection(clock.outputs[0], instance.inputs[0])
+    Connection(instance.outputs[0], counter.outputs[0])
+    assert CycleSimulator(counter, [counter.outputs[0]]).run(4) == bytes([0, 1, 0, 1])
+    clock.outputs[0].remove_observer(instance.inputs[0])
+    Connection(clock.outputs[0], not1.inputs[0])
+    Connection(not1.outputs[0], instance.inputs[0])
+    with pytest.raises(ValueError, match='not clocked by a Clock'):
+        counter.compile()
+
+
+def test_instance_flip_flops():
+    # an instance of the toggle toggles like the toggle
+    top = Component('top', 1, 1)
+    instance = Instance('toggle', toggle_with_clock_input())
+    top.add_circuit(instance)
+    Connection(top.inputs[0], instance.inputs[0])
+    Connection(instance.outputs[0], top.outputs[0])
+    for circuit in [toggle_with_clock_input(), top]:
+        states = []
+        for clock in [False, True, False, True, False, True]:
+            circuit.set_input(0, clock)
+            circuit.process()
+            states.append(circuit.outputs[0].is_state())
+        assert states == [False, True, True, False, False, True]
+
+
+def test_latch_does_not_compile():
+    # the latch of gates is settled by process(), but compiled circuits
+    # keep state only in flip-flops
+    latch = Component('latch', 1, 1)
+    or1 = Or('or1')
+    latch.add_circuit(or1)
+    Connection(latch.inputs[0], or1.inputs[0])
+    Connection(or1.outputs[0], or1.inputs[1])
+    Connection(or1.outputs[0], latch.outputs[0])
+    with pytest.raises(ValueError, match='combinational loop'):
+        latch.compile()
+
+
+def test_log_connections(tmp_path):
+    file_name = os.path.join(tmp_path, 'connections.jsonl')
+    stop = log_connections(file_name)
+    build_xor()
+    stop()
+    assert logger.level == logging.NOTSET and logger.propagate
+    with open(file_name) as file:
+        lines = [json.loads(line) for line in file]
+    assert len(lines) == 8 and lines[0]['event'] == 'connect'
+    assert lines[0]['pin_from'] == 'xor/input 0'
+
+
+def test_long_chains():
+    # longer than the recursion limit: a chain of pins, and a component of a
+    # chain of buffers, that is also copied
+    length = 2 * sys.getrecursionlimit()
+    pins = [Pin('pin{}'.format(k)) for k in range(length)]
+    for pin_from, pin_to in zip(pins, pins[1:]):
+        Connection(pin_from, pin_to)
+    pins[0].set_state(True)
+    assert pins[-1].is_state()
+    chain = Component('chain', 1, 1)
+    buffers = [And('and{}'.format(k), 1) for k in range(length)]
+    pin_from = chain.inputs[0]
+    for buffer in buffers:
+        chain.add_circuit(buffer)
+        Connection(pin_from, buffer.inputs[0])
+        pin_from = buffer.outputs[0]
+    Connection(pin_from, chain.outputs[0])
+    copy = deepcopy(chain)
+    for state in [True, False]:
+        copy.set_input(0, state)
+        copy.process()
+        assert copy.outputs[0].is_state() == state
+
+
+def test_instances():
+    # three inputs parity from two instances of a xor, that is stored only once
+    xor = build_xor()
+    parity = Component('parity', 3, 1)
+    xor_a = Instance('xor_a', xor)
+    xor_b = Instance('xor_b', xor)
+    parity.add_circuit(xor_a)
+    parity.add_circuit(xor_b)
+    Connection(parity.inputs[0], xor_a.inputs[0])
+    Connection(parity.inputs[1], xor_a.inputs[1])
+    Connection(xor_a.outputs[0], xor_b.inputs[0])
+    Connection(parity.inputs[2], xor_b.inputs[1])
+    Connection(xor_b.outputs[0], parity.outputs[0])
+    for states, (exp_s, exp_co) in ONE_BIT_ADDER_TABLE:
+        set_inputs(parity, states)
+        parity.process()
+        assert output_states(parity) == [exp_s]
+        assert parity.compile().evaluate(states) == [exp_s]
+    # the compiled circuits are made again only when their structure, or
+    # that of the definitions of their instances, changes
+    compiled_xor, compiled_parity = xor.compile(), parity.compile()
+    Pin('u').add_observer(Pin('v'))
+    build_one_bit_adder()
+    assert xor.compile() is compiled_xor and parity.compile() is compiled_parity
+    xor.circuits[0].rename('or0')
+    assert xor.compile() is not compiled_xor and parity.compile() is not compiled_parity
+
+
+def test_wide_gates():
+    # a decoder of 3 bits to 8 lines
+    decoder = Component('decoder', 3, 8)
+    for line in range(8):
+        gate = And('and{}'.format(line), 3)
+        decoder.add_circuit(gate)
+        for bit in range(3):
+            if line >> bit & 1:
+                Connection(decoder.inputs[bit], gate.inputs[bit])
+            else:
+                inverter = Not('not{}_{}'.format(line, bit))
+                decoder.add_circuit(inverter)
+                Connection(decoder.inputs[bit], inverter.inputs[0])
+                Connection(inverter.outputs[0], gate.inputs[bit])
+        Connection(gate.outputs[0], decoder.outputs[line])
+    for value in range(8):
+        set_inputs(decoder, [value >> bit & 1 == 1 for bit in range(3)])
+        decoder.process()
+        assert output_states(decoder) == [line == value for line in range(8)]
+
+
+@pytest.mark.parametrize('gate_class', [Xor, Nand, Nor, Xnor])
+def test_native_gates(gate_class):
+    gate = gate_class('gate', 3)
+    for v in range(8):
+        set_inputs(gate, [v >> k & 1 == 1 for k in range(3)])
+        gate.process()
+        ones = bin(v).count('1')
+        assert gate.outputs[0].is_state() == {Xor: ones % 2 == 1, Nand: ones < 3,
+                                              Nor: ones == 0, Xnor: ones % 2 == 0}[gate_class]
+
+
+@pytest.mark.parametrize('gate_class', [And, Or, Not, Nand, Nor, Xor, Xnor, Mux])
+def test_packed_type(gate_class):
+    # words of the type of mask, like NumPy bool columns, give a result of
+    # that type, here single bools
+    num_inputs = 1 if gate_class is Not else 3 # a Mux of 3 is a 2:1 mux
+    for v in range(2**num_inputs):
+        words = [v >> k & 1 == 1 for k in range(num_inputs)]
+        result = gate_class.packed_function(words, True)
+        assert type(result) is bool and result == bool(gate_class.bit_function(words))
+
+
+def test_native_one_bit_adder():
+    adder = build_native_one_bit_adder()
+    assert adder.compile().num_gates == 3
+    assert build_one_bit_adder().compile().num_gates == 11
+    for states, expected in ONE_BIT_ADDER_TABLE:
+        set_inputs(adder, states)
+        adder.process()
+        assert output_states(adder) == expected
+
+
+def test_native_one_bit_adder_batch():
+    np = pytest.importorskip('numpy')
+    inputs = np.array([states for states, _ in ONE_BIT_ADDER_TABLE])
+    copy = inputs.copy()
+    outputs = build_native_one_bit_adder().evaluate_batch(inputs)
+    assert outputs.tolist() == [expected for _, expected in ONE_BIT_ADDER_TABLE]
+    assert (inputs == copy).all()
+
+
+def test_profiler():
+    adder = build_one_bit_adder()
+    with Profiler() as profiler:
+        adder.process()
+    assert profiler.stats['OneBitAdder/xor1/and1'].calls == 1
+    assert profiler.stats['OneBitAdder/xor1/and1'].notifications == 1 # to not1
+    assert Pin.notification_hook is None
+    assert profiler.levels()[2].calls == 8 # the gates of the two xors
+
+
+@pytest.mark.parametrize('build_cell', [build_one_bit_adder, build_native_one_bit_adder])
+def test_n_bits_adder(build_cell):
+    adder = build_n_bits_adder(N, build_cell)
+    for v in range(0, 2**(2*N + 1), 7):
+        set_inputs(adder, [v >> k & 1 == 1 for k in range(2*N + 1)])
+        adder.process()
+        assert sum(state << k for k, state in enumerate(output_states(adder))) == \
+            n_bits_adder_reference(v)
+
+
+def test_exhaustive_bit_parallel():
+    compiled = build_n_bits_adder(N).compile()
+    for start, count, words in compiled.exhaustive():
+        for v, res in enumerate(unpack_words(words, count), start):
+            assert res == n_bits_adder_reference(v)
+
+
+def test_verify_in_processes():
+    report = verify(build_n_bits_adder(N), n_bits_adder_reference, range(2**(2*N + 1)),
+                    shard_size=64)
+    assert report.num_vectors == 2**(2*N + 1) and not report.mismatches
+
+
+def test_verify_finds_mismatches():
+    report = verify(build_n_bits_adder(N), lambda v: n_bits_adder_reference(v) ^ 1,
+                    range(2**(2*N + 1)), workers=0, max_mismatches=5)
+    assert len(report.mismatches) == 5
+
+
+def test_stimulus():
+    # corner cases, walking ones and seeded random vectors
+    stimulus = Stimulus([N, N, 1], seed=1)
+    assert list(stimulus.vectors(100)) == list(Stimulus([N, N, 1], seed=1).vectors(100))
+    report = verify(build_n_bits_adder(N), n_bits_adder_reference, stimulus.vectors(1000),
+                    workers=0)
+    assert not report.mismatches
+    # a field of 0 bits has only the value 0
+    assert sorted(Stimulus([0, 3]).corner_cases()) == [0, 1, 4, 6, 7]
+
+
+def test_propagate():
+    # changing the carry in of 0 + 0 only re-evaluates the gates it
+    # reaches, and changing it to the same value none
+    compiled = build_n_bits_adder(N).compile()
+    for k in range(2*N + 1):
+        compiled.set_input(k, False)
+    compiled.propagate()
+    compiled.set_input(2*N, True)
+    assert 0 < compiled.propagate() < compiled.num_gates
+    assert compiled.get_output(0)
+    compiled.set_input(2*N, True)
+    assert compiled.propagate() == 0
+
+
+def adder_with_buses():
+    adder = build_n_bits_adder(N)
+    adder.add_bus('A', adder.inputs[:N])
+    adder.add_bus('B', adder.inputs[N:2*N])
+    adder.add_bus('S', adder.outputs)
+    return adder
+
+
+def test_buses():
+    adder = adder_with_buses()
+    adder.inputs[2*N].set_state(False)
+    compiled = adder.compile()
+    compiled.set_input(2*N, False)
+    for i, j in [(0, 0), (1, 2**N - 1), (2**N - 1, 2**N - 1)]:
+        adder.bus('A').set_value(i)
+        adder.bus('B').set_value(j)
+        adder.process()
+        assert adder.bus('S').value() == i + j
+        # the buses of the compiled circuit are slices of the net states
+        compiled.bus('A').set_value(i)
+        compiled.bus('B').set_value(j)
+        compiled.propagate()
+        assert compiled.bus('S').value() == i + j
+
+
+def test_ints_to_bits(batch_type):
+    rows = ints_to_bits([2**N - 1, 6, 1], 2*N + 1) # vectors as in exhaustive()
+    assert isinstance(rows, batch_type)
+    assert list(bits_to_ints(build_n_bits_adder(N).evaluate_batch(rows))) == [2**N - 1, 6, 1]
+
+
+def test_netlist_file(tmp_path):
+    compiled = adder_with_buses().compile()
+    file_name = os.path.join(tmp_path, 'adder.net')
+    compiled.save(file_name)
+    with CompiledCircuit.load(file_name) as loaded:
+        for start, count, words in loaded.exhaustive():
+            assert words == compiled.evaluate_packed(exhaustive_words(2*N + 1, start, count), count)
+        loaded.bus('A').set_value(3)
+        loaded.bus('B').set_value(4)
+        loaded.propagate()
+        assert loaded.bus('S').value() == 7
+        name = '{}BitsAdder/oneBitAdder1/xor1/or1/output 0'.format(N)
+        assert loaded.net(name) == compiled.net(name)
+    assert loaded.mapped is None
+    with pytest.raises(ValueError): # the views of the file have been released
+        loaded.fanin[0]
+
+
+@pytest.mark.parametrize('write, read', [(write_blif, read_blif), (write_verilog, read_verilog)])
+@pytest.mark.parametrize('compiled', [False, True])
+def test_netlist_formats(tmp_path, write, read, compiled):
+    file_name = os.path.join(tmp_path, 'adder')
+    for adder in [build_n_bits_adder(N), build_n_bits_adder(N, build_native_one_bit_adder)]:
+        write(adder, file_name)
+        report = verify(read(file_name, compiled), n_bits_adder_reference,
+                        range(2**(2*N + 1)), workers=0)
+        assert not report.mismatches
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+@pytest.mark.parametrize('x_first', [False, True])
+def test_blif_inverted_cover(tmp_path, compiled, x_first):
+    # x, a cover of the rows where it is 0, used inverted, before or after
+    # its cover: y = z = a and b and c
+    x = '.names a b x\n11 0\n'
+    yz = '.names x c y\n01 1\n.names x c z\n01 1\n'
+    file_name = os.path.join(tmp_path, 'inverted.blif')
+    with open(file_name, 'w') as file:
+        file.write('.model inverted\n.inputs a b c\n.outputs y z\n')
+        file.write(x + yz if x_first else yz + x)
+        file.write('.end\n')
+    report = verify(read_blif(file_name, compiled), lambda v: 3 if v == 7 else 0,
+                    range(8), workers=0)
+    assert not report.mismatches
+
+
+def test_wide_xor_blif(tmp_path):
+    # a parity of 9 inputs and its inverse, written as trees of 2 input
+    # xors of 2 rows each instead of covers of 256 rows
+    parity = Component('parity', 9, 2)
+    xor, xnor = Xor('xor', 9), Xnor('xnor', 9)
+    for gate in [xor, xnor]:
+        parity.add_circuit(gate)
+        for pin_from, pin_to in zip(parity.inputs, gate.inputs):
+            Connection(pin_from, pin_to)
+    Connection(xor.outputs[0], parity.outputs[0])
+    Connection(xnor.outputs[0], parity.outputs[1])
+    file_name = os.path.join(tmp_path, 'parity.blif')
+    write_blif(parity, file_name)
+    with open(file_name) as file:
+        assert len(file.readlines()) < 60
+    report = verify(read_blif(file_name), lambda v: 1 + (bin(v).count('1') % 2 == 0),
+                    range(2**9), workers=0)
+    assert not report.mismatches
+
+
+def test_optimize():
+    # without the carry out, the or that makes the carry out of the last one
+    # bit adder is dead, and in every one bit adder the ands of the carry
+    # are the same as the first and of each xor. The carry out, always
+    # False, is a gate of no inputs
+    adder = build_n_bits_adder(N)
+    carry_out = adder.circuits[-1].outputs[1]
+    carry_out.remove_observer(adder.outputs[N])
+    assert carry_out.observers == () # the empty tuple shared by all pins
+    adder.outputs[N].set_state(False)
+    optimized = optimize(adder, compiled=True)
+    assert optimized.num_gates == 9*N - 1 + 1
+    report = verify(optimized, lambda v: n_bits_adder_reference(v) % 2**N,
+                    range(2**(2*N + 1)), workers=0)
+    assert not report.mismatches
+    # and with the carry in tied to False, the second xor of the first one
+    # bit adder passes the output of the first one through, to S through a
+    # buffer, and its or the output of the and of A and B
+    optimized = optimize(adder, {2*N: False})
+    assert len(optimized.circuits) == 9*N - 4
+    report = verify(optimized, lambda v: n_bits_adder_reference(v) % 2**N,
+                    range(2**(2*N)), workers=0)
+    assert not report.mismatches
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_optimize_random_netlists(seed):
+    # random netlists of every cell, with repeated inputs, constants and
+    # inverted nets, and some inputs tied, are the same for every vector
+    generator = random.Random(seed)
+    builder = NetlistBuilder('random{}'.format(seed))
+    nets = ['in{}'.format(k) for k in range(5)]
+    for net in nets:
+        builder.add_input(net)
+    for g in range(30):
+        cell = generator.choice([And, Or, Not, Nand, Nor, Xor, Xnor, Mux])
+        if cell is Not:
+            num_inputs = 1
+        elif cell is Mux:
+            num_inputs = generator.choice([3, 6])
+        else:
+            num_inputs = generator.randint(1, 4)
+        ins = [generator.choice(nets) for _ in range(num_inputs)]
+        if generator.random() < 0.2:
+            ins[0] = builder.constant(generator.random() < 0.5)
+        if generator.random() < 0.2:
+            ins[-1] = builder.inverted(ins[-1])
+        nets.append('g{}'.format(g))
+        builder.add_gate(cell, ins, nets[-1])
+    for net in generator.sample(nets[5:], 6):
+        builder.add_output(net)
+    circuit = builder.finish()
+    tied = {k: generator.random() < 0.5 for k in generator.sample(range(5), 2)}
+    reference = circuit.compile()
+    for constants in [None, tied]:
+        optimized = optimize(circuit, constants, compiled=True)
+        assert optimized.num_gates <= reference.num_gates + len(reference.output_nets)
+        for v in range(2**5):
+            states = [v >> k & 1 == 1 for k in range(5)]
+            for k, state in (constants or {}).items():
+                states[k] = state
+            assert optimized.evaluate(states) == reference.evaluate(states)
+
+
+def test_benchmarks(tmp_path):
+    file_name = os.path.join(tmp_path, 'results.json')
+    results, regressions = run_benchmarks([('xor', build_xor)], file_name)
+    with open(file_name) as file:
+        assert json.load(file) == results
+    assert results['designs']['xor']['gates'] == 4
+    baseline = deepcopy(results)
+    baseline['designs']['xor']['bytes_per_gate'] /= 2
+    assert [regression.split(':')[0] for regression in compare_benchmarks(results, baseline)] == \
+        ['xor bytes_per_gate']